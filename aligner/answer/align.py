@@ -3,9 +3,20 @@
 
 import os
 import sys
+import shutil
 import argparse
+import tempfile
+import itertools
+import collections
+import multiprocessing
 
-from collections import defaultdict
+import numpy as np
+
+import corpus
+import posteriors
+import symmetrize
+from ttable import TranslationTable, count_pairs
+from distortion import DistortionTable, pack, unpack
 
 argparser = argparse.ArgumentParser()
 argparser.add_argument("-d", "--datadir", dest="datadir", default="data", help="data directory (default=data)")
@@ -16,104 +27,343 @@ argparser.add_argument("-s", "--smoothing", dest="smooth", default=0.001, type=f
 argparser.add_argument("-S", "--Smoothing", dest="Smooth", default=0.003, type=float, help="add_n smoothing value for distortion")
 argparser.add_argument("-n", "--num_sentences", dest="num_sents", default=2**64, type=int, help="Number of sentences to use for training and alignment")
 argparser.add_argument("-i", "--num_iteration", dest="num_iter", default=5, type=int, help="Number of iteration/epoch number")
+argparser.add_argument("-m", "--distortion_mb", dest="distortion_mb", default=64, type=float, help="memory budget of the distortion table in MB, rarer sentence lengths share relative position buckets (default=64)")
+argparser.add_argument("-w", "--workers", dest="workers", default=1, type=int, help="number of worker processes for the E-step, the parameters are shared with them by fork")
+argparser.add_argument("-c", "--checkpoint", dest="checkpoint", default=None, help="write the parameters to CHECKPOINT.fe.npz and CHECKPOINT.ef.npz after every iteration, and the vocabularies to CHECKPOINT.f.vocab and CHECKPOINT.e.vocab")
+argparser.add_argument("-r", "--resume", dest="resume", action="store_true", default=False, help="continue training from the last iteration saved in --checkpoint")
+argparser.add_argument("--online", dest="online", action="store_true", default=False, help="stepwise EM, update the parameters after every --batch_size sentences, -i is then the number of passes")
+argparser.add_argument("--batch_size", dest="batch_size", default=1000, type=int, help="sentences per update with --online (default=1000)")
+argparser.add_argument("--decay", dest="decay", default=0.7, type=float, help="step size (k + 2) ** -decay of the k-th update with --online, between 0.5 and 1 (default=0.7)")
+argparser.add_argument("--update", dest="update", action="store_true", default=False, help="fold the data into the parameters saved in --checkpoint with --online passes, save them back and align the data")
+argparser.add_argument("--symmetrize", dest="symmetrize", default="intersect", choices=sorted(symmetrize.METHODS), help="how the links of the two directions are combined (default=intersect)")
+argparser.add_argument("--tmpdir", dest="tmpdir", default=None, help="directory for the encoded corpus and the other files made while aligning")
+argparser.add_argument("--align_only", dest="align_only", action="store_true", default=False, help="do not train, align the data with the parameters saved in --checkpoint")
+argparser.add_argument("--prune_top", dest="prune_top", default=0, type=int, help="keep only the PRUNE_TOP pairs with the highest t of each f word when pruning t (default=0, all)")
+argparser.add_argument("--prune_floor", dest="prune_floor", default=0.0, type=float, help="drop the pairs with t below PRUNE_FLOOR when pruning t (default=0)")
+argparser.add_argument("--ttable_mb", dest="ttable_mb", default=None, type=float, help="when pruning t, then keep the pairs with the highest t that fit in TTABLE_MB MB")
+argparser.add_argument("--prune_after", dest="prune_after", default=2, type=int, help="prune t after every iteration from this one on, with --prune_top, --prune_floor or --ttable_mb (default=2)")
+argparser.add_argument("--posteriors", dest="posteriors", default=None, help="also write the posterior of every link of at least --posterior_min to POSTERIORS.fe.post and POSTERIORS.ef.post, see posteriors.py")
+argparser.add_argument("--posterior_min", dest="posterior_min", default=0.01, type=float, help="smallest posterior written with --posteriors (default=0.01)")
+argparser.add_argument("--threshold", dest="threshold", default=None, type=float, help="output the links whose posterior is at least THRESHOLD in both directions instead of combining the best links with --symmetrize")
 args = argparser.parse_args()
+if (args.resume or args.align_only or args.update) and not args.checkpoint:
+    argparser.error("--resume, --align_only and --update need --checkpoint")
+# folding in new data is done with stepwise EM
+args.online = args.online or args.update
+# a pool would be forked for every mini-batch to see the updated parameters
+if args.online and args.workers > 1:
+    argparser.error("--workers is not supported with --online or --update")
+if args.threshold is not None:
+    args.posterior_min = min(args.posterior_min, args.threshold)
+
+def expected_counts(bitext, positions, t, a, null_word, offset=0, block=1000):
+    """E-step over bitext, each sentence is one I x (J + 1) matrix with NULL in column 0,
+    positions are the indices of its pairs into t.data in row order, see TranslationTable.positions.
+    Returns the expected counts of the pairs of t (indexed like t.data), of NULL and
+    of the distortion matrices, see DistortionTable.accumulate"""
+    # pairs pruned from t point one past its end, where they score 0
+    data = np.append(t.data, 0.0)
+    count_t = np.zeros(len(t) + 1)
+    count_null = 0.0
+    count_a = {}
+    pending, weights = [], []
+    for k, ((f, e), pos) in enumerate(zip(bitext, positions), offset):
+        if k % 10000 == 0:
+            sys.stderr.write("     %d\n" % k)
+        I, J = len(f), len(e)
+        p = np.empty((I, J + 1))
+        p[:, 0] = t.null[f]
+        p[:, 1:] = data[pos].reshape(I, J)
+        p *= a[I, J]
+        z = p.sum(axis=1, keepdims=True)
+        c = np.divide(p, z, out=np.zeros_like(p), where=z > 0)
+        pending.append(pos)
+        weights.append(c[:, 1:].ravel())
+        count_null += c[:, 0].sum()
+        a.accumulate(count_a, (I, J), c)
+        # scatter the pair counts a block of sentences at a time
+        if len(pending) == block:
+            count_t += np.bincount(np.concatenate(pending), weights=np.concatenate(weights), minlength=len(t) + 1)
+            pending, weights = [], []
+    if pending:
+        count_t += np.bincount(np.concatenate(pending), weights=np.concatenate(weights), minlength=len(t) + 1)
+    return count_t[:-1], count_null, count_a
+
+
+# what the E-step workers read, set before they are forked
+shared = None
+
+
+def expected_counts_shard(shard):
+    (start, stop, offset) = shard
+    (bitext, positions, t, a, null_word) = shared
+    return expected_counts(bitext[start:stop], positions[start:stop], t, a, null_word, offset + start)
+
 
-def align(bitext):
-    t = defaultdict(float)
-    a = defaultdict(float)
-    
-    sys.stderr.write("Init parameters...\n")
-    count_e = defaultdict(float)
-    count_f = defaultdict(float)
-    count_ef = defaultdict(float)
-    for f, e in bitext:
-        I = len(f)
-        J = len(e)
-        for i, f_i in enumerate(f):
-            for j, e_j in enumerate(e):
-                count_f[f_i] += 1.0
-                count_e[e_j] += 1.0
-                count_ef[(f_i, e_j)] += 1.0
-                a[(j, i, I, J)] = 1.0 / (J+1)
-            a[-1, i, I, J] = 1.0 / (J+1)
-        #t[f_i, None] = 1.0 / (I * J)
-    for f, e in count_ef:
-        t[(f, e)] = count_ef[(f, e)] / (count_e[e] * count_f[f])
+def e_step(bitext, positions, t, a, null_word, workers=1, offset=0):
+    """expected_counts over the whole bitext, split into one shard per worker process
+    when workers > 1, the partial counts are summed. offset is the number of the
+    first sentence, for the progress messages"""
+    if workers <= 1:
+        return expected_counts(bitext, positions, t, a, null_word, offset)
+    global shared
+    shared = (bitext, positions, t, a, null_word)
+    bounds = np.linspace(0, len(bitext), workers + 1).astype(int).tolist()
+    # a new pool each iteration, so the forked workers see the current parameters
+    with multiprocessing.get_context('fork').Pool(workers) as pool:
+        parts = pool.map(expected_counts_shard, [(start, stop, offset) for start, stop in zip(bounds[:-1], bounds[1:])])
+    shared = None
+    (count_t, count_null, count_a) = parts[0]
+    for part_t, part_null, part_a in parts[1:]:
+        count_t += part_t
+        count_null += part_null
+        for shape, c in part_a.items():
+            if shape in count_a:
+                count_a[shape] += c
+            else:
+                count_a[shape] = c
+    return count_t, count_null, count_a
 
+
+def save_checkpoint(filename, t, a, null_word, counts, progress):
+    """Write the parameters and the expected counts they were estimated from, the old
+    checkpoint is only replaced once the new one is complete. progress has the number
+    of iterations, of stepwise updates and of sentences the counts cover"""
+    (count_t, count_null, count_a) = counts
+    state = dict(t.state(), **a.state())
+    state.update(pack(count_a, 'count_a'), count_t=count_t, count_null=count_null)
+    with open(filename + '.tmp', 'wb') as out:
+        np.savez(out, null_word=-1 if null_word is None else null_word, **dict(state, **progress))
+    os.replace(filename + '.tmp', filename)
+
+
+def load_checkpoint(filename):
+    """Read what save_checkpoint wrote, returns t, a, null_word, the expected counts
+    and the progress dict"""
+    with np.load(filename) as checkpoint:
+        state = dict(checkpoint)
+    null_word = int(state['null_word'])
+    counts = (state['count_t'], float(state['count_null']), unpack(state, 'count_a'))
+    progress = {key: int(state[key]) for key in ('iterations', 'steps', 'sentences')}
+    return TranslationTable.from_state(state), DistortionTable.from_state(state), (null_word if null_word >= 0 else None), counts, progress
+
+
+def m_step(t, a, null_word, counts):
+    """Estimate the parameters from the expected counts, with add-n smoothing"""
+    (count_t, count_null, count_a) = counts
     V, S = 100000, 10000
-    # traning
-    for T in range(args.num_iter):
-        sys.stderr.write("Starting Iteration %d ...\n" % T)
-        expected_count_t_fe = defaultdict(float)
-        expected_count_t_e = defaultdict(float)
-        expected_count_a_fe = defaultdict(float)
-        expected_count_a_e = defaultdict(float)
-
-        for k, (f, e) in enumerate(bitext):
-            if k % 10000 == 0:
-                 sys.stderr.write("     %d\n" % k)
-            I, J = len(f), len(e)
-            for i in range(I):
-                # calculate the normalization term
-                z = t[(f[i], None)] * a[(-1, i, I, J)]
-                for j in range(J):
-                    z += t[(f[i], e[j])] * a[(j, i, I, J)]
-                # calculate expected count
-                for j in range(J):
-                    c = t[(f[i], e[j])] * a[(j, i, I, J)] / z
-                    expected_count_t_fe[(f[i], e[j])] += c
-                    expected_count_t_e[e[j]] += c
-                    expected_count_a_fe[(j, i, I, J)] += c
-                    expected_count_a_e[(i, I, J)] += c
-
-                c = t[(f[i], None)] * a[(-1, i, I, J)] / z
-                expected_count_t_fe[(f_i, None)] += c
-                expected_count_t_e[None] += c
-                expected_count_a_fe[(-1, i, I, J)] += c
-                expected_count_a_e[(i, I, J)] += c
-        
-        # smoothing
-        sys.stderr.write("smoothing...\n")
-        for f, e in expected_count_t_fe:
-            t[(f, e)] = (expected_count_t_fe[(f, e)] + args.smooth) / (expected_count_t_e[e] + args.smooth * V)
-        for i, j, I, J in expected_count_a_fe:
-            a[(i, j, I, J)] = (expected_count_a_fe[(i, j, I, J)] + args.Smooth) / (expected_count_a_e[j, I, J] + args.Smooth * S)
-    
-    # align and output result
-    sys.stderr.write("aligning...\n")
-    alignments = []
-    for f, e in bitext:
-        I, J = len(f), len(e)
-        alignments.append([])
-        for i, f_i in enumerate(f):
-            best_p = t[(f_i, None)] * a[-1, i, I, J]
-            best_j = -1
-            for j, e_j in enumerate(e):
-                p = t[(f_i, e_j)] * a[j, i, I, J]
-                if p > best_p:
-                    best_p = p
-                    best_j = j
-            if best_j >= 0:
-                alignments[-1].append((i, best_j))
-    return alignments
+    t.data = (count_t + args.smooth) / (t.expected_e(count_t)[t.columns] + args.smooth * V)
+    if null_word is not None:
+        t.null[null_word] = (count_null + args.smooth) / (count_null + args.smooth * V)
+    a.update(count_a, args.Smooth, S)
+
+
+def prune(t, counts, positions, filename):
+    """Prune t with --prune_top, --prune_floor and --ttable_mb, move the expected counts
+    of the pairs kept and remap positions into the file filename. Returns the new
+    counts and positions"""
+    size = len(t)
+    kept = t.prune(args.prune_top, args.prune_floor, None if args.ttable_mb is None else args.ttable_mb * 2**20)
+    sys.stderr.write("pruned t from %d to %d pairs, %d kB\n" % (size, len(t), t.nbytes // 1024))
+    # the pruned pairs and the ones already missing go one past the end of the new table
+    remap = np.full(size + 1, len(t), dtype=np.int64)
+    remap[kept] = np.arange(len(t))
+    (count_t, count_null, count_a) = counts
+    return (count_t[kept], count_null, count_a), positions.remap(remap, filename)
+
+
+def interpolate(counts, new, eta):
+    """Stepwise EM, move the counts a step eta towards the new counts, in place"""
+    (count_t, count_null, count_a) = counts
+    (new_t, new_null, new_a) = new
+    count_t *= 1 - eta
+    count_t += eta * new_t
+    for shape in count_a:
+        count_a[shape] *= 1 - eta
+    for shape, c in new_a.items():
+        if shape in count_a:
+            count_a[shape] += eta * c
+        else:
+            count_a[shape] = eta * c
+    return count_t, (1 - eta) * count_null + eta * new_null, count_a
+
+
+def scale(counts, factor):
+    (count_t, count_null, count_a) = counts
+    return count_t * factor, count_null * factor, {shape: c * factor for shape, c in count_a.items()}
+
+
+def link_scores(bitext, t, a, positions=None, block=10000):
+    """Generate the sentences a block at a time as (size, groups), where the sentences
+    of a block are grouped by length pair: a group is (indices, p), p the (n, I, J+1)
+    array of t * a of its n sentences, NULL in column 0, and indices their numbers in
+    the block. Without positions the pairs are looked up in t, and pairs it does not
+    have get t = 0"""
+    data = np.append(t.data, 0.0)
+    for start in range(0, len(bitext), block):
+        sentences = list(bitext[start:start + block])
+        pairs = list(positions[start:start + block]) if positions is not None else None
+        shapes = collections.defaultdict(list)
+        for k, (f, e) in enumerate(sentences):
+            shapes[len(f), len(e)].append(k)
+        groups = []
+        for (I, J), indices in shapes.items():
+            n = len(indices)
+            f = np.array([sentences[k][0] for k in indices]).reshape(n, I)
+            p = np.empty((n, I, J + 1))
+            p[:, :, 0] = t.lookup_null(f)
+            if pairs is not None:
+                p[:, :, 1:] = data[np.array([pairs[k] for k in indices]).reshape(n, I, J)]
+            else:
+                p[:, :, 1:] = t.lookup(f, np.array([sentences[k][1] for k in indices]).reshape(n, J))
+            p *= a[I, J]
+            groups.append((indices, p))
+        yield len(sentences), groups
+
+
+def write_links(bitext, t, a, links, posterior=None, positions=None):
+    """Write the best j of every f word of each sentence, -1 for NULL, to the file links
+    for corpus.Ragged.open. With a posterior file name, also write there the links of
+    each sentence whose posterior is at least --posterior_min, as posteriors.POSTERIOR
+    records; the posteriors are the scores normalized over j as in the E-step"""
+    best_out = corpus.RaggedWriter(links)
+    posterior_out = corpus.RaggedWriter(posterior, posteriors.POSTERIOR) if posterior else None
+    for size, groups in link_scores(bitext, t, a, positions):
+        (best, sparse) = ([None] * size, [None] * size)
+        for indices, p in groups:
+            # argmax takes the first best, so ties go to NULL and then to the smaller j
+            for k, links in zip(indices, p.argmax(axis=2) - 1):
+                best[k] = links
+            if posterior_out:
+                z = p.sum(axis=2, keepdims=True)
+                q = np.divide(p, z, out=np.zeros_like(p), where=z > 0)
+                for k, qk in zip(indices, q[:, :, 1:]):
+                    sparse[k] = posteriors.sparse(qk, args.posterior_min)
+        for k in range(size):
+            best_out.append(best[k])
+            if posterior_out:
+                posterior_out.append(sparse[k])
+    best_out.close()
+    if posterior_out:
+        posterior_out.close()
+
+
+def align(bitext, num_f, num_e, links, checkpoint=None, posterior=None):
+    """IBM model 2 over a bitext of (f ids, e ids) int arrays, see corpus.compile,
+    writes the best j of every f word of each sentence to the file links, and the link
+    posteriors to the file posterior if given, see write_links. The parameters are saved to the
+    checkpoint file after every iteration, and read from it with --resume, --align_only
+    or --update"""
+    progress = {'iterations': 0, 'steps': 0, 'sentences': len(bitext)}
+    counts = None
+    if checkpoint and (args.align_only or args.update or (args.resume and os.path.exists(checkpoint))):
+        sys.stderr.write("Loading %s...\n" % checkpoint)
+        (t, a, null_word, counts, progress) = load_checkpoint(checkpoint)
+        if args.align_only:
+            sys.stderr.write("aligning...\n")
+            write_links(bitext, t, a, links, posterior)
+            return
+        if args.update:
+            # new pairs start from zero counts, the counts then cover the new sentences too
+            moved = t.extend(count_pairs(bitext, num_e)[0], num_f, num_e)
+            count_t = np.zeros(len(t))
+            count_t[moved] = counts[0]
+            counts = (count_t, counts[1], counts[2])
+            m_step(t, a, null_word, counts)
+            progress = dict(progress, iterations=0, sentences=progress['sentences'] + len(bitext))
+        elif (t.num_f, t.num_e) != (num_f, num_e) or not np.isin(t.keys, count_pairs(bitext, num_e)[0]).all():
+            raise ValueError("%s was trained on different data" % checkpoint)
+    else:
+        sys.stderr.write("Init parameters...\n")
+        t = TranslationTable.from_bitext(bitext, num_f, num_e)
+        # a[I, J][i, 1 + j] is a(j | i, I, J), column 0 is NULL
+        a = DistortionTable.from_bitext(bitext, args.distortion_mb * 2**20)
+        # as in the dict version, the NULL counts of every word are credited to the
+        # last French word of the bitext, every other word keeps t(f|NULL) = 0
+        null_word = next((f[-1] for f, e in reversed(bitext) if len(f)), None)
+    # the pairs of a sentence are looked up once, not in every iteration, and kept on disk
+    with tempfile.TemporaryDirectory(dir=args.tmpdir) as tmpdir:
+        writer = corpus.RaggedWriter(os.path.join(tmpdir, 'positions'))
+        for f, e in bitext:
+            writer.append(t.positions(f, e).ravel())
+        positions = writer.close()
+
+        # traning
+        for T in range(progress['iterations'], args.num_iter):
+            sys.stderr.write("Starting Iteration %d ...\n" % T)
+            if not args.online:
+                counts = e_step(bitext, positions, t, a, null_word, args.workers)
+                # smoothing
+                sys.stderr.write("smoothing...\n")
+                m_step(t, a, null_word, counts)
+            for start in range(0, len(bitext) if args.online else 0, args.batch_size):
+                stop = min(start + args.batch_size, len(bitext))
+                # the counts of a batch are scaled up to all the sentences seen, so
+                # the smoothing weighs the same as in batch EM
+                new = scale(e_step(bitext[start:stop], positions[start:stop], t, a, null_word, offset=start), progress['sentences'] / (stop - start))
+                counts = new if counts is None else interpolate(counts, new, (progress['steps'] + 2) ** -args.decay)
+                progress['steps'] += 1
+                m_step(t, a, null_word, counts)
+            if (args.prune_top or args.prune_floor or args.ttable_mb is not None) and T + 1 >= args.prune_after:
+                (counts, positions) = prune(t, counts, positions, os.path.join(tmpdir, 'positions.%d' % T))
+            progress['iterations'] = T + 1
+            if checkpoint:
+                save_checkpoint(checkpoint, t, a, null_word, counts, progress)
+
+        # align and output result
+        sys.stderr.write("aligning...\n")
+        write_links(bitext, t, a, links, posterior, positions)
+
+
+def align_both(bitext, num_f, num_e, workdir, checkpoint=None, posterior=None):
+    """Train the f -> e and e -> f models at the same time, the e -> f one in a forked
+    child process, over the same encoded bitext. Their links are written to files in
+    workdir, whose names are returned, their posteriors to posterior.fe.post and
+    posterior.ef.post if given, and their parameters are checkpointed to
+    checkpoint.fe.npz and checkpoint.ef.npz"""
+    (checkpoint_1, checkpoint_2) = (checkpoint + '.fe.npz', checkpoint + '.ef.npz') if checkpoint else (None, None)
+    (posterior_1, posterior_2) = (posterior + '.fe.post', posterior + '.ef.post') if posterior else (None, None)
+    (links_1, links_2) = (os.path.join(workdir, 'fe.links'), os.path.join(workdir, 'ef.links'))
+
+    child = multiprocessing.get_context('fork').Process(target=align, args=(bitext.swap(), num_e, num_f, links_2, checkpoint_2, posterior_2))
+    child.start()
+    align(bitext, num_f, num_e, links_1, checkpoint_1, posterior_1)
+    child.join()
+    if child.exitcode != 0:
+        raise RuntimeError("the e -> f model failed with exit code %s" % child.exitcode)
+    return links_1, links_2
 
 
 if __name__ == '__main__':
     sys.stderr.write("Read data...\n")
     f_data = "%s.%s" % (os.path.join(args.datadir, args.fileprefix), args.french)
     e_data = "%s.%s" % (os.path.join(args.datadir, args.fileprefix), args.english)
-    bitext = [[sentence.strip().split() for sentence in pair] for pair in list(zip(open(f_data), open(e_data)))[:args.num_sents]]
-    bitext_2 = [[sentence.strip().split() for sentence in pair] for pair in list(zip(open(e_data), open(f_data)))[:args.num_sents]]
-
-    aligns_1 = align(bitext)
-    aligns_2 = align(bitext_2)
-
-    # output intersection of 2 alignments
-    sys.stderr.write("intersecting aligns...\n")
-    for k, a in enumerate(aligns_1):
-        for i, j in a:
-            if (j, i) in aligns_2[k]:
-                sys.stdout.write("%i-%i " % (i, j))
-        sys.stdout.write("\n")
-        
-    
\ No newline at end of file
+    workdir = tempfile.mkdtemp(dir=args.tmpdir)
+    try:
+        # one encoding serves both directions, the e -> f model swaps the pairs;
+        # a saved model keeps the ids it was trained with
+        (f_vocab, e_vocab) = (None, None)
+        if args.checkpoint and (args.align_only or args.update or (args.resume and os.path.exists(args.checkpoint + '.f.vocab'))):
+            f_vocab = corpus.Vocab.load(args.checkpoint + '.f.vocab')
+            e_vocab = corpus.Vocab.load(args.checkpoint + '.e.vocab')
+        with open(f_data) as f, open(e_data) as e:
+            pairs = itertools.islice(zip(f, e), min(args.num_sents, sys.maxsize))
+            (bitext, new_f_vocab, new_e_vocab) = corpus.compile(pairs, os.path.join(workdir, 'bitext'), f_vocab, e_vocab)
+        if args.checkpoint and (f_vocab is None or args.update):
+            new_f_vocab.save(args.checkpoint + '.f.vocab')
+            new_e_vocab.save(args.checkpoint + '.e.vocab')
+        # thresholding reads the posteriors, kept in workdir unless they are asked for
+        posterior = args.posteriors or (os.path.join(workdir, 'posterior') if args.threshold is not None else None)
+        (links_1, links_2) = align_both(bitext, len(new_f_vocab), len(new_e_vocab), workdir, args.checkpoint, posterior)
+
+        # output the combined links of the 2 directions
+        if args.threshold is not None:
+            sys.stderr.write("thresholding posteriors...\n")
+            posteriors.write_thresholded(posterior + '.fe.post', posterior + '.ef.post', args.threshold, sys.stdout)
+        else:
+            sys.stderr.write("symmetrizing aligns...\n")
+            combine = symmetrize.METHODS[args.symmetrize]
+            for fe, ef in zip(corpus.Ragged.open(links_1), corpus.Ragged.open(links_2)):
+                sys.stdout.write("".join("%d-%d " % link for link in combine(fe, ef)) + "\n")
+    finally:
+        shutil.rmtree(workdir)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import array
+
+import numpy as np
+
+
+class Vocab(object):
+    """Maps words to consecutive integer ids, in order of first appearance"""
+    def __init__(self):
+        self.ids = {}
+        self.words = []
+
+    @classmethod
+    def load(cls, filename):
+        """Read a vocabulary written by save(), the ids are the line numbers"""
+        vocab = cls()
+        with open(filename) as f:
+            for line in f:
+                vocab.id(line.rstrip('\n'))
+        return vocab
+
+    def save(self, filename):
+        """Write the words one per line in id order"""
+        with open(filename, 'w') as out:
+            out.writelines(word + '\n' for word in self.words)
+
+    def __len__(self):
+        return len(self.words)
+
+    def id(self, word):
+        """Get the id of word, adding it if it is new"""
+        i = self.ids.get(word)
+        if i is None:
+            i = self.ids[word] = len(self.words)
+            self.words.append(word)
+        return i
+
+    def encode(self, words):
+        """int32 array of the ids of words"""
+        return np.array([self.id(word) for word in words], dtype=np.int32)
+
+
+class Ragged(object):
+    """A sequence of arrays (int32 by default) stored back to back in a memory mapped file, item k
+    is data[offsets[k]:offsets[k + 1]], a view into the mapping, and slices of the
+    sequence share the mapping too"""
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def open(cls, filename, dtype=np.int32):
+        """Map a file written by RaggedWriter"""
+        offsets = np.load(filename + '.offsets.npy', mmap_mode='r')
+        if os.path.getsize(filename) == 0:
+            return cls(np.zeros(0, dtype=dtype), offsets)
+        return cls(np.memmap(filename, dtype=dtype, mode='r').view(np.ndarray), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            (start, stop, _) = k.indices(len(self))
+            return Ragged(self.data, self.offsets[start:max(start, stop) + 1])
+        if k < 0:
+            k += len(self)
+        return self.data[self.offsets[k]:self.offsets[k + 1]]
+
+    def __iter__(self, block=10000):
+        for start in range(0, len(self), block):
+            offsets = self.offsets[start:start + block + 1].tolist()
+            for begin, end in zip(offsets, offsets[1:]):
+                yield self.data[begin:end]
+
+    def remap(self, table, filename, block=2**22):
+        """Write table[values] of every item to filename and map it, the offsets stay the same"""
+        (begin, end) = (int(self.offsets[0]), int(self.offsets[-1]))
+        with open(filename, 'wb') as out:
+            for start in range(begin, end, block):
+                table[self.data[start:min(start + block, end)]].astype(self.data.dtype).tofile(out)
+        np.save(filename + '.offsets.npy', self.offsets - begin)
+        return Ragged.open(filename, self.data.dtype)
+
+
+class RaggedWriter(object):
+    """Writes arrays one after the other to a file for Ragged.open"""
+    def __init__(self, filename, dtype=np.int32, block=10000):
+        self.filename = filename
+        self.dtype = dtype
+        self.block = block
+        self.out = open(filename, 'wb')
+        self.offsets = array.array('q', [0])
+        self.pending = []
+
+    def append(self, values):
+        values = np.asarray(values, dtype=self.dtype)
+        self.pending.append(values)
+        self.offsets.append(self.offsets[-1] + len(values))
+        if len(self.pending) == self.block:
+            self._flush()
+
+    def _flush(self):
+        if self.pending:
+            np.concatenate(self.pending).tofile(self.out)
+            self.pending = []
+
+    def close(self):
+        """Finish the file and map it"""
+        self._flush()
+        self.out.close()
+        np.save(self.filename + '.offsets.npy', np.frombuffer(self.offsets, dtype=np.int64))
+        return Ragged.open(self.filename, self.dtype)
+
+
+class Bitext(object):
+    """Sentence pairs of a compiled corpus, pair k is (f ids, e ids); iterating and
+    slicing do not copy the mapped files"""
+    def __init__(self, f, e):
+        self.f = f
+        self.e = e
+
+    def __len__(self):
+        return len(self.f)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return Bitext(self.f[k], self.e[k])
+        return self.f[k], self.e[k]
+
+    def __iter__(self):
+        return zip(self.f, self.e)
+
+    def swap(self):
+        """The same pairs as (e ids, f ids)"""
+        return Bitext(self.e, self.f)
+
+
+def compile(pairs, prefix, f_vocab=None, e_vocab=None):
+    """Tokenize and encode (f line, e line) pairs into prefix.f and prefix.e in one pass,
+    returns the mapped Bitext and the f and e vocabularies, which are extended with new words"""
+    f_vocab = f_vocab if f_vocab is not None else Vocab()
+    e_vocab = e_vocab if e_vocab is not None else Vocab()
+    (f_out, e_out) = (RaggedWriter(prefix + '.f'), RaggedWriter(prefix + '.e'))
+    for f, e in pairs:
+        f_out.append(f_vocab.encode(f.strip().split()))
+        e_out.append(e_vocab.encode(e.strip().split()))
+    return Bitext(f_out.close(), e_out.close()), f_vocab, e_vocab
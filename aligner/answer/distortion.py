@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import collections
+
+import numpy as np
+
+
+def pack(matrices, prefix):
+    """Arrays for np.savez holding a dict of (I, J) -> matrix, which may have the
+    shared matrix under None like the counts of DistortionTable.accumulate"""
+    shapes = sorted(shape for shape in matrices if shape is not None)
+    return {
+        prefix + '_shapes': np.array(shapes, dtype=np.int64).reshape(-1, 2),
+        prefix + '_exact': np.concatenate([matrices[shape].ravel() for shape in shapes]) if shapes else np.zeros(0),
+        prefix + '_relative': matrices[None] if None in matrices else np.zeros((0, 0)),
+    }
+
+
+def unpack(state, prefix):
+    """The dict saved by pack"""
+    matrices = {}
+    offset = 0
+    for I, J in state[prefix + '_shapes'].tolist():
+        matrices[I, J] = state[prefix + '_exact'][offset:offset + I * (J + 1)].reshape(I, J + 1)
+        offset += I * (J + 1)
+    if state[prefix + '_relative'].size:
+        matrices[None] = state[prefix + '_relative']
+    return matrices
+
+
+class DistortionTable(object):
+    """a(j | i, I, J) as one (I, J+1) matrix per sentence length pair, column 0 is NULL.
+    The most frequent length pairs get their own matrix until budget bytes are used,
+    the others share one (buckets, buckets+1) matrix indexed by the relative positions
+    i / I and j / J, so the size does not depend on the sentence lengths seen.
+    Only the ratios within a row matter, the E-step and the argmax normalize over j."""
+    def __init__(self, shapes, budget, buckets=20):
+        """shapes counts the sentences of each (I, J)"""
+        self.buckets = buckets
+        self.exact = {}
+        size = buckets * (buckets + 1) * 8
+        for (I, J), _ in sorted(shapes.items(), key=lambda item: (-item[1], item[0])):
+            if size + I * (J + 1) * 8 > budget:
+                continue
+            size += I * (J + 1) * 8
+            self.exact[I, J] = np.full((I, J + 1), 1.0 / (J + 1))
+        self.relative = np.ones((buckets, buckets + 1))
+        shared = sum(count for shape, count in shapes.items() if shape not in self.exact)
+        sys.stderr.write("distortion: %d length pairs in %d kB, %d sentences in shared buckets\n" % (len(self.exact), size // 1024, shared))
+
+    @classmethod
+    def from_bitext(cls, bitext, budget, buckets=20):
+        return cls(collections.Counter((len(f), len(e)) for f, e in bitext), budget, buckets)
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a table saved with state()"""
+        a = cls.__new__(cls)
+        a.exact = unpack(state, 'a')
+        a.relative = a.exact.pop(None)
+        a.buckets = len(a.relative)
+        return a
+
+    def state(self):
+        """The arrays that make up the table, for np.savez"""
+        matrices = dict(self.exact)
+        matrices[None] = self.relative
+        return pack(matrices, 'a')
+
+    def _bins(self, I, J):
+        """Row and column of the relative matrix of every (i, j), NULL stays in column 0"""
+        rows = np.arange(I) * self.buckets // I
+        columns = np.concatenate(([0], 1 + np.arange(J) * self.buckets // max(J, 1)))
+        return rows[:, None], columns[None, :]
+
+    def __getitem__(self, shape):
+        if shape in self.exact:
+            return self.exact[shape]
+        return self.relative[self._bins(*shape)]
+
+    def accumulate(self, counts, shape, c):
+        """Add the expected counts c of a sentence of this shape to the counts dict,
+        shared shapes are summed under the key None"""
+        if shape in self.exact:
+            if shape in counts:
+                counts[shape] += c
+            else:
+                counts[shape] = c
+            return
+        (rows, columns) = self._bins(*shape)
+        width = self.buckets + 1
+        relative = np.bincount((rows * width + columns).ravel(), weights=c.ravel(), minlength=self.buckets * width)
+        if None in counts:
+            counts[None] += relative.reshape(self.buckets, width)
+        else:
+            counts[None] = relative.reshape(self.buckets, width)
+
+    def update(self, counts, smooth, S):
+        """M-step with add-n smoothing"""
+        for shape, c in counts.items():
+            a = (c + smooth) / (c.sum(axis=1, keepdims=True) + smooth * S)
+            if shape is None:
+                self.relative = a
+            else:
+                self.exact[shape] = a
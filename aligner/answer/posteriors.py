@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import argparse
+
+import numpy as np
+
+import corpus
+
+# one link of a sentence, f word i, e word j and its posterior probability
+POSTERIOR = np.dtype([('i', '<u2'), ('j', '<u2'), ('p', '<f4')])
+
+argparser = argparse.ArgumentParser(description="links from the posteriors written by align.py --posteriors, run from the aligner directory")
+argparser.add_argument("-i", "--input", dest="input", required=True, help="prefix of the posterior files, INPUT.fe.post and INPUT.ef.post")
+argparser.add_argument("-t", "--threshold", dest="threshold", default=0.5, type=float, help="minimum posterior of a link in both directions (default=0.5)")
+
+
+def sparse(q, minimum):
+    """The links of an I x J posterior matrix with a posterior of at least minimum"""
+    (i, j) = np.nonzero(q >= minimum)
+    links = np.empty(len(i), dtype=POSTERIOR)
+    links['i'] = i
+    links['j'] = j
+    links['p'] = q[i, j]
+    return links
+
+
+def threshold_links(fe, ef, threshold):
+    """The (i, j) links with a posterior of at least threshold in both directions,
+    fe has the links of the f -> e model and ef those of the e -> f model, (j, i) pairs"""
+    forward = {(i, j) for i, j, p in fe.tolist() if p >= threshold}
+    return sorted((i, j) for j, i, p in ef.tolist() if p >= threshold and (i, j) in forward)
+
+
+def write_thresholded(fe_filename, ef_filename, threshold, out):
+    """Write the links of every sentence of two posterior files, one line each"""
+    for fe, ef in zip(corpus.Ragged.open(fe_filename, POSTERIOR), corpus.Ragged.open(ef_filename, POSTERIOR)):
+        out.write("".join("%d-%d " % link for link in threshold_links(fe, ef, threshold)) + "\n")
+
+
+if __name__ == '__main__':
+    args = argparser.parse_args()
+    write_thresholded(args.input + '.fe.post', args.input + '.ef.post', args.threshold, sys.stdout)
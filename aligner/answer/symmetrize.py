@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+# the 8 points around a link
+NEIGHBOURS = [(-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+
+def links(fe, ef):
+    """The (i, j) links of the two directions as sets; fe[i] is the j of f word i in the
+    f -> e model and ef[j] the i of e word j in the e -> f model, -1 for NULL"""
+    return ({(i, j) for i, j in enumerate(fe.tolist()) if j >= 0},
+            {(i, j) for j, i in enumerate(ef.tolist()) if i >= 0})
+
+
+def intersect(fe, ef):
+    """Links found by both directions, in order of i"""
+    i = np.flatnonzero(fe >= 0)
+    j = fe[i]
+    keep = ef[j] == i
+    return list(zip(i[keep].tolist(), j[keep].tolist()))
+
+
+def grow_diag_final(fe, ef):
+    """Start from the intersection and add the links of the union next to a link
+    (diagonals included) whose f or e word is not aligned yet, until none can be added,
+    then add the links of each direction whose f or e word is still not aligned"""
+    (fe_links, ef_links) = links(fe, ef)
+    union = fe_links | ef_links
+    alignment = fe_links & ef_links
+    aligned_f = {i for i, j in alignment}
+    aligned_e = {j for i, j in alignment}
+
+    def add(i, j):
+        alignment.add((i, j))
+        aligned_f.add(i)
+        aligned_e.add(j)
+
+    grown = True
+    while grown:
+        grown = False
+        for i, j in sorted(alignment):
+            for di, dj in NEIGHBOURS:
+                point = (i + di, j + dj)
+                if point in union and point not in alignment and (point[0] not in aligned_f or point[1] not in aligned_e):
+                    add(*point)
+                    grown = True
+    for direction in (fe_links, ef_links):
+        for i, j in sorted(direction):
+            if i not in aligned_f or j not in aligned_e:
+                add(i, j)
+    return sorted(alignment)
+
+
+METHODS = {'intersect': intersect, 'grow-diag-final': grow_diag_final}
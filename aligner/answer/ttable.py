@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+# bytes per pair of the table, its key, probability and column
+PAIR_BYTES = 8 + 8 + 4
+
+
+def count_pairs(bitext, num_e, block=10000):
+    """Sorted keys f * num_e + e of the (f, e) pairs co-occurring in bitext, and the
+    number of times each co-occurs; the pairs of every block sentences are merged
+    into the running result, so memory follows the number of distinct pairs"""
+    keys, counts = np.zeros(0, dtype=np.int64), np.zeros(0)
+    pending = []
+    for k, (f, e) in enumerate(bitext):
+        pending.append((f.astype(np.int64)[:, None] * num_e + e).ravel())
+        if (k + 1) % block == 0:
+            (keys, counts) = merge_counts(keys, counts, np.concatenate(pending))
+            pending = []
+    if pending:
+        (keys, counts) = merge_counts(keys, counts, np.concatenate(pending))
+    return keys, counts
+
+
+def merge_counts(keys, counts, new):
+    """Add the keys new, with repeats, to the sorted keys and their counts"""
+    (merged, inverse) = np.unique(np.concatenate((keys, new)), return_inverse=True)
+    weights = np.concatenate((counts, np.ones(len(new))))
+    return merged, np.bincount(inverse.ravel(), weights=weights, minlength=len(merged))
+
+
+class TranslationTable(object):
+    """t(f|e) over the (f, e) pairs that co-occur in the bitext, stored CSR style:
+    the pairs are sorted by f then e, row f is indptr[f]:indptr[f + 1] of
+    columns (the e ids) and data (the probabilities). null[f] is t(f|NULL)."""
+    def __init__(self, keys, data, num_f, num_e):
+        self.num_f = num_f
+        self.num_e = num_e
+        self.keys = keys
+        self.data = data
+        self.columns = (keys % num_e).astype(np.int32)
+        self.indptr = np.searchsorted(keys, np.arange(num_f + 1, dtype=np.int64) * num_e)
+        self.null = np.zeros(num_f)
+
+    @classmethod
+    def from_bitext(cls, bitext, num_f, num_e):
+        """Initialize t(f|e) to c(f, e) / (c(f) c(e)) over the co-occurrence counts"""
+        (keys, counts) = count_pairs(bitext, num_e)
+        count_f = np.bincount(keys // num_e, weights=counts, minlength=num_f)
+        count_e = np.bincount(keys % num_e, weights=counts, minlength=num_e)
+        return cls(keys, counts / (count_e[keys % num_e] * count_f[keys // num_e]), num_f, num_e)
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a table saved with state()"""
+        (num_f, num_e) = state['t_shape'].tolist()
+        t = cls(state['t_keys'], state['t_data'], num_f, num_e)
+        t.null = state['t_null']
+        return t
+
+    def state(self):
+        """The arrays that make up the table, for np.savez"""
+        return {'t_keys': self.keys, 't_data': self.data, 't_null': self.null, 't_shape': np.array([self.num_f, self.num_e])}
+
+    def extend(self, keys, num_f, num_e):
+        """Add the pairs keys (f * num_e + e) that are not in the table yet, with t = 0, for
+        vocabularies grown to num_f and num_e words. Returns the new index of every old
+        pair, to move other arrays indexed like data"""
+        old = (self.keys // self.num_e) * num_e + self.keys % self.num_e
+        merged = np.union1d(old, keys)
+        moved = np.searchsorted(merged, old)
+        data = np.zeros(len(merged))
+        data[moved] = self.data
+        null = np.zeros(num_f)
+        null[:self.num_f] = self.null
+        self.__init__(merged, data, num_f, num_e)
+        self.null = null
+        return moved
+
+    def prune(self, top=0, floor=0.0, budget=None):
+        """Drop the pairs with t below floor and, with top, those that are not among the
+        top best e of their f; then if the table still takes more than budget bytes, drop
+        the pairs with the lowest t until it fits. Returns the old index of every pair kept,
+        to move other arrays indexed like data"""
+        keep = self.data >= floor
+        if top:
+            rows = np.repeat(np.arange(self.num_f), np.diff(self.indptr))
+            # the pairs of each f by decreasing t, ties to the smaller e
+            order = np.lexsort((-self.data, rows))
+            rank = np.empty(len(self), dtype=np.int64)
+            rank[order] = np.arange(len(self)) - self.indptr[rows[order]]
+            keep &= rank < top
+        kept = np.flatnonzero(keep)
+        if budget is not None:
+            room = max(0, int((budget - self.indptr.nbytes - self.null.nbytes) // PAIR_BYTES))
+            if len(kept) > room:
+                kept = np.sort(kept[np.argpartition(-self.data[kept], room)[:room]]) if room else kept[:0]
+        null = self.null
+        self.__init__(self.keys[kept], self.data[kept], self.num_f, self.num_e)
+        self.null = null
+        return kept
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def nbytes(self):
+        return self.keys.nbytes + self.data.nbytes + self.columns.nbytes + self.indptr.nbytes + self.null.nbytes
+
+    def positions(self, f, e):
+        """Index into data of every (f[i], e[j]) pair as an I x J array, len(self) for
+        pairs that are not in the table, e.g. pruned ones"""
+        query = f.astype(np.int64)[:, None] * self.num_e + e
+        if not len(self.keys):
+            return np.zeros(query.shape, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.keys, query), len(self.keys) - 1)
+        return np.where(self.keys[pos] == query, pos, len(self.keys))
+
+    def lookup(self, f, e):
+        """t(f[i]|e[j]) as an I x J array, 0 for pairs that are not in the table, e.g.
+        pairs of words that are new to the table's vocabulary. f and e can also be
+        (n, I) and (n, J) arrays of n sentences of the same lengths"""
+        f = f[..., :, None].astype(np.int64)
+        e = e[..., None, :]
+        if not len(self.keys):
+            return np.zeros(np.broadcast(f, e).shape)
+        query = f * self.num_e + e
+        pos = np.minimum(np.searchsorted(self.keys, query), len(self.keys) - 1)
+        return np.where((f < self.num_f) & (e < self.num_e) & (self.keys[pos] == query), self.data[pos], 0.0)
+
+    def lookup_null(self, f):
+        """t(f|NULL) of every id in f, 0 for new words"""
+        return np.where(f < self.num_f, self.null[np.minimum(f, self.num_f - 1)], 0.0) if self.num_f else np.zeros(f.shape)
+
+    def expected_e(self, counts):
+        """Sum the expected counts of the pairs over f, giving the count of each e"""
+        return np.bincount(self.columns, weights=counts, minlength=self.num_e)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+
+class BatchUnigram(object):
+    """Unigram method over a batch of sentences at once, the dynamic programming
+    runs column by column over the whole batch with numpy"""
+    def __init__(self, prob_dist, lexicon, maxlen):
+        self.prob_dist = prob_dist
+        self.lexicon = lexicon
+        self.maxlen = maxlen
+
+    def scores(self, sentences):
+        """scores[b, i, j] is the log probability of the word of length j ending at
+        character i of sentence b, sentences are padded to the longest one"""
+        length = max(len(chars) for chars in sentences)
+        scores = np.zeros((len(sentences), length, self.maxlen + 1))
+        logprobs = self.prob_dist.logprobs
+        for b, chars in enumerate(sentences):
+            if chars:
+                scores[b, :len(chars)] = self.prob_dist.unknown_logprobs(chars, self.maxlen)
+            for i, words in enumerate(self.lexicon.words_by_end(chars, self.maxlen)):
+                for j, word_id in words.items():
+                    scores[b, i, j] = logprobs[word_id]
+        return scores
+
+    def segment(self, sentences):
+        """Return the best segmentation of every sentence as a list of words"""
+        if not sentences or not any(sentences):
+            return [[] for _ in sentences]
+        scores = self.scores(sentences)
+        (batch, length, _) = scores.shape
+        rows = np.arange(batch)
+        # chart[b, e] is the best score of the first e characters of sentence b and
+        # backpointer[b, e] the length of the last word of that segmentation
+        chart = np.full((batch, length + 1), -np.inf)
+        chart[:, 0] = 0.0
+        backpointer = np.zeros((batch, length + 1), dtype=np.int32)
+        for e in range(1, length + 1):
+            width = min(self.maxlen, e)
+            # column j - 1 holds the score of ending the segmentation with a word of length j
+            candidates = chart[:, e - width:e][:, ::-1] + scores[:, e - 1, 1:width + 1]
+            best = candidates.argmax(axis=1)
+            chart[:, e] = candidates[rows, best]
+            backpointer[:, e] = best + 1
+
+        result = []
+        for b, chars in enumerate(sentences):
+            words = []
+            e = len(chars)
+            while e > 0:
+                j = int(backpointer[b, e])
+                words.append("".join(chars[e-j:e]))
+                e -= j
+            words.reverse()
+            result.append(words)
+        return result
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import json
+import time
+import cProfile
+import resource
+import argparse
+import tempfile
+import subprocess
+
+import segment
+
+# arguments, anything else is passed on to segment.py
+argparser = argparse.ArgumentParser(description="benchmark answer/segment.py, run from the segmenter directory")
+argparser.add_argument("--modes", dest='modes', nargs='+', default=['unigram', 'bigram'], choices=['unigram', 'bigram'], help="segmentation methods to benchmark")
+argparser.add_argument("--referencefile", dest='reference', type=str, default=os.path.join('data', 'reference'), help="reference segmentation of --inputfile")
+argparser.add_argument("--profile", dest='profile', type=str, default=None, help="write cProfile stats of the segmentation loop to PROFILE.<mode>")
+argparser.add_argument("--output", dest='output', type=str, default=None, help="write the results as json to this file (default: stdout)")
+argparser.add_argument("--run", dest='run', type=str, default=None, help=argparse.SUPPRESS)
+
+
+def percentile(values, p):
+    """Nearest rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def fscore(output, reference):
+    """F-score of the output file from score-segments.py"""
+    scorer = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'score-segments.py')
+    result = subprocess.run([sys.executable, scorer, '-t', output, '-r', reference], stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    return float(re.search(r'Score: ([0-9.]+)', result.stdout).group(1))
+
+
+def run(mode, opts):
+    """Benchmark one method in this process and return the measurements"""
+    args = segment.args
+    args.enable_unigram = (mode == 'unigram')
+    # every line is segmented, not answered from the cache
+    (args.cachesize, args.cachefile) = (0, None)
+
+    start = time.perf_counter()
+    segment.load_models()
+    load_time = time.perf_counter() - start
+
+    with open(args.input) as f:
+        lines = [line.strip() for line in f]
+    profile = cProfile.Profile() if opts.profile else None
+    latencies = []
+    output = []
+    start = time.perf_counter()
+    if profile:
+        profile.enable()
+    for n, line in enumerate(lines):
+        line_start = time.perf_counter()
+        result = segment.run_segmenter(line)
+        latencies.append(time.perf_counter() - line_start)
+        output.append(segment.format_result(n, result))
+    if profile:
+        profile.disable()
+        profile.dump_stats("%s.%s" % (opts.profile, mode))
+    segment_time = time.perf_counter() - start
+
+    with tempfile.NamedTemporaryFile('w', suffix='.out', delete=False) as out:
+        out.writelines(output)
+    try:
+        score = fscore(out.name, opts.reference)
+    finally:
+        os.remove(out.name)
+
+    latencies.sort()
+    chars = sum(len(line) for line in lines)
+    return {
+        'mode': mode,
+        'lines': len(lines),
+        'chars': chars,
+        'unigram_entries': len(segment.prob_dist),
+        'bigram_entries': len(segment.prob_dist2),
+        'load_seconds': load_time,
+        'segment_seconds': segment_time,
+        'chars_per_second': chars / segment_time if segment_time else 0.0,
+        'latency_ms': {p: 1000 * percentile(latencies, float(p[1:])) for p in ('p50', 'p90', 'p99', 'p100')},
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'fscore': score,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    (opts, segment_argv) = argparser.parse_known_args()
+    segment.args = segment.argparser.parse_args(segment_argv)
+
+    if opts.run:
+        # child process, so load time and peak memory are measured for one method alone
+        json.dump(run(opts.run, opts), sys.stdout)
+        sys.exit(0)
+
+    results = []
+    for mode in opts.modes:
+        sys.stderr.write("Benchmarking %s...\n" % mode)
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', mode] + sys.argv[1:], stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        result = json.loads(child.stdout)
+        results.append(result)
+        sys.stderr.write("  load %.3fs, segment %.3fs, %.0f chars/s, latency p50 %.2fms p99 %.2fms, peak rss %d kB, F %.2f\n" % (
+            result['load_seconds'], result['segment_seconds'], result['chars_per_second'],
+            result['latency_ms']['p50'], result['latency_ms']['p99'], result['peak_rss_kb'], result['fscore']))
+
+    report = {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'segment_args': segment_argv,
+        'results': results,
+    }
+    if opts.output:
+        with open(opts.output, 'w') as out:
+            json.dump(report, out, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
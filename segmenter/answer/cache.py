@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import shelve
+import hashlib
+from collections import OrderedDict
+
+
+def fingerprint(filenames, settings):
+    """Hash the contents of the model files and the settings that change the output"""
+    digest = hashlib.sha1()
+    for filename in filenames:
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    digest.update(repr(settings).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class LRUCache(object):
+    """Bounded LRU cache of results, optionally backed by a persistent store on disk.
+    Entries of the store are prefixed by the model fingerprint, so a store can be
+    shared by different models; without a store the fingerprint is not used and may be None"""
+    def __init__(self, maxsize, fingerprint, filename=None):
+        self.maxsize = maxsize
+        self.prefix = fingerprint + '\t' if filename else None
+        self.entries = OrderedDict()
+        self.store = shelve.open(filename) if filename else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Get the result for key, or None if it is not cached"""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        if self.store is not None:
+            value = self.store.get(self.prefix + key)
+            if value is not None:
+                self._remember(key, value)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def repeat(self):
+        """Count a key that repeats one already looked up in the same batch as a hit"""
+        self.hits += 1
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.store is not None:
+            self.store[self.prefix + key] = value
+
+    def _remember(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+
+    def report(self, out=sys.stderr):
+        out.write("cache: %d hits (%d from disk), %d misses\n" % (self.hits, self.disk_hits, self.misses))
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import argparse
+import itertools
+import urllib.request
+
+argparser = argparse.ArgumentParser(description="segment a file with a running answer/server.py")
+argparser.add_argument("--server", dest='server', type=str, default='http://127.0.0.1:8413', help="server address")
+argparser.add_argument("--inputfile", dest="input", type=str, default=os.path.join('data', 'input'), help="input file to segment, - for stdin")
+argparser.add_argument("--chunksize", dest='chunksize', type=int, default=256, help="number of lines sent in one request")
+
+
+def segment(lines, server):
+    """Send lines to the server and return its output"""
+    request = urllib.request.Request(server + '/segment', data="".join(line + "\n" for line in lines).encode('utf-8'), method='POST')
+    with urllib.request.urlopen(request) as response:
+        return response.read().decode('utf-8')
+
+
+if __name__ == '__main__':
+    args = argparser.parse_args()
+    f = sys.stdin if args.input == '-' else open(args.input)
+    while True:
+        chunk = [line.rstrip('\n') for line in itertools.islice(f, args.chunksize)]
+        if not chunk:
+            break
+        sys.stdout.write(segment(chunk, args.server))
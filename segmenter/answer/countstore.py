@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import math
+import mmap
+import zlib
+import struct
+import argparse
+from array import array
+
+# Binary layout of a compiled count file (native byte order):
+#   header   MAGIC, VERSION, BYTE_ORDER, n entries, n nodes, n slots, key bytes,
+#            total count and total types (before pruning), quantization bits,
+#            checksum of the keys, counts and total types, n pairs and the
+#            checksum of the unigram table the pairs were compiled against
+#   counts   n x int64, in key order
+#   logprobs n x float64, log(count / total count), or when quantized a
+#            codebook of 2^bits float64 followed by n codes, padded to 8 bytes
+#   offsets  (n + 1) x uint32 into the key blob
+#   nodes    one per distinct prefix (in characters) of the keys, the keys included:
+#            n nodes x uint32 each of lo, hi and bytes, the keys starting with the
+#            prefix are the entries lo to hi - 1 and the prefix is the first bytes of key lo
+#   slots    open addressing hash table of node index + 1 (0 = empty)
+#   keys     utf-8 keys, sorted, concatenated, padded to 8 bytes
+#   pairs    for a bigram table compiled with a unigram table: n pairs x int64
+#            sorted keys id1 * n unigrams + id2 of the bigrams of two unigram
+#            ids, then n pairs x float64 Laplacian log probabilities
+#            log((count + 1) / (count of word 1 + unigram total types))
+MAGIC = b'SEGC'
+VERSION = 5
+BYTE_ORDER = 0x01020304
+HEADER = struct.Struct('=4sIIIIIQddIIQI4x')
+CODES = {8: 'B', 16: 'H'}
+SUFFIX = '.bin'
+
+
+def read_counts(filenames, sep='\t'):
+    """Sum the counts of every key in the tab separated count files"""
+    counts = {}
+    for filename in filenames:
+        for line in open(filename, 'r'):
+            (key, freq) = line.split(sep)
+            counts[key] = counts.get(key, 0) + int(freq)
+    return counts
+
+
+def prune_counts(counts, mincount=1, topn=None):
+    """Keep the keys counted at least mincount times, and at most the topn most frequent of them"""
+    kept = [(key, value) for (key, value) in counts.items() if value >= mincount]
+    if topn is not None and len(kept) > topn:
+        kept.sort(key=lambda item: -item[1])
+        del kept[topn:]
+    return dict(kept)
+
+
+def quantize(values, bits):
+    """Quantize values linearly into 2^bits levels, return the codes and the codebook of level values"""
+    levels = 1 << bits
+    lo = min(values, default=0.0)
+    hi = max(values, default=0.0)
+    step = (hi - lo) / (levels - 1) if hi > lo else 1.0
+    codes = array(CODES[bits], (int(round((value - lo) / step)) for value in values))
+    codebook = array('d', (lo + code * step for code in range(levels)))
+    return (codes, codebook)
+
+
+class QuantizedArray(object):
+    """Read-only sequence of quantized values, decoded through the codebook on access"""
+    def __init__(self, codes, codebook):
+        self.codes = codes
+        self.codebook = codebook
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        return self.codebook[self.codes[index]]
+
+
+def _slot(key_bytes, mask):
+    return zlib.crc32(key_bytes) & mask
+
+
+def bigram_pairs(counts, unigrams):
+    """Sorted id pair keys and Laplacian log probabilities of the 'word1 word2' keys of
+    counts whose words are both in the CountTable unigrams"""
+    pairs = []
+    for key, value in counts.items():
+        (word1, word2) = key.split(' ')
+        id1 = unigrams.index(word1)
+        id2 = unigrams.index(word2)
+        # pairs with a word outside the unigram lexicon are never candidates
+        if id1 < 0 or id2 < 0:
+            continue
+        pairs.append((id1 * len(unigrams) + id2, math.log((value + 1) / (unigrams.value(id1) + unigrams.totaltype))))
+    pairs.sort()
+    return (array('q', (key for key, _ in pairs)), array('d', (logprob for _, logprob in pairs)))
+
+
+def write_counts(counts, filename, totalvalue=None, totaltype=None, bits=0, unigrams=None):
+    """Write the counts dict to filename as a compiled count table. The totals
+    default to those of counts, pass the totals before pruning to keep the
+    probabilities of the remaining keys; bits of 8 or 16 quantize the log probabilities.
+    For bigram counts, unigrams is the CountTable whose ids the bigram log probabilities
+    are stored under"""
+    items = sorted((key.encode('utf-8'), value) for (key, value) in counts.items())
+    n = len(items)
+    values = array('q')
+    offsets = array('I', [0])
+    blob = bytearray()
+    # the keys sharing a prefix are consecutive in sorted order
+    nodes = {}
+    for index, (key, value) in enumerate(items):
+        values.append(value)
+        blob += key
+        offsets.append(len(blob))
+        text = key.decode('utf-8')
+        for length in range(1, len(text) + 1):
+            prefix = text[:length].encode('utf-8')
+            if prefix in nodes:
+                nodes[prefix][1] = index + 1
+            else:
+                nodes[prefix] = [index, index + 1]
+
+    nslots = 1
+    while nslots < 2 * len(nodes):
+        nslots *= 2
+    mask = nslots - 1
+    (lo, hi, nbytes) = (array('I'), array('I'), array('I'))
+    slots = array('I', [0]) * nslots
+    for node, (prefix, (first, last)) in enumerate(nodes.items()):
+        lo.append(first)
+        hi.append(last)
+        nbytes.append(len(prefix))
+        h = _slot(prefix, mask)
+        while slots[h]:
+            h = (h + 1) & mask
+        slots[h] = node + 1
+
+    totalvalue = float(sum(values) if totalvalue is None else totalvalue)
+    totaltype = float(n if totaltype is None else totaltype)
+    logprobs = [math.log(value / totalvalue) for value in values]
+    checksum = zlib.crc32(struct.pack('=d', totaltype), zlib.crc32(values.tobytes(), zlib.crc32(blob)))
+    (pair_keys, pair_logprobs) = bigram_pairs(counts, unigrams) if unigrams is not None else (array('q'), array('d'))
+    pair_checksum = unigrams.checksum if unigrams is not None else 0
+    with open(filename, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, VERSION, BYTE_ORDER, n, len(nodes), nslots, len(blob), totalvalue, totaltype, bits, checksum, len(pair_keys), pair_checksum))
+        values.tofile(out)
+        if bits:
+            (codes, codebook) = quantize(logprobs, bits)
+            codebook.tofile(out)
+            codes.tofile(out)
+            out.write(b'\0' * (-len(codes) * codes.itemsize % 8))
+        else:
+            array('d', logprobs).tofile(out)
+        offsets.tofile(out)
+        lo.tofile(out)
+        hi.tofile(out)
+        nbytes.tofile(out)
+        slots.tofile(out)
+        out.write(blob)
+        out.write(b'\0' * (-(out.tell()) % 8))
+        pair_keys.tofile(out)
+        pair_logprobs.tofile(out)
+
+
+class CountTable(object):
+    """Read-only view of a compiled count file, memory mapped from disk"""
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, byte_order, n, nnodes, nslots, nbytes, totalvalue, totaltype, bits, checksum, npairs, pair_checksum) = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a compiled count file" % filename)
+        if byte_order != BYTE_ORDER:
+            raise ValueError("%s was compiled on a machine with a different byte order" % filename)
+        self.totalvalue = totalvalue
+        self.totaltype = totaltype
+        self.checksum = checksum
+        self.pair_checksum = pair_checksum
+        self._n = n
+        self._mask = nslots - 1
+
+        view = memoryview(self._mmap)
+        start = HEADER.size
+        self._counts = view[start:start + 8 * n].cast('q')
+        start += 8 * n
+        if bits:
+            codebook = view[start:start + 8 * (1 << bits)].cast('d')
+            start += 8 * (1 << bits)
+            size = n * bits // 8
+            codes = view[start:start + size].cast(CODES[bits])
+            start += size + (-size % 8)
+            self.logprobs = QuantizedArray(codes, codebook)
+            self._views = [codebook, codes]
+        else:
+            self.logprobs = view[start:start + 8 * n].cast('d')
+            start += 8 * n
+            self._views = [self.logprobs]
+        self._offsets = view[start:start + 4 * (n + 1)].cast('I')
+        start += 4 * (n + 1)
+        (self._lo, self._hi, self._nbytes) = [view[start + 4 * nnodes * k:start + 4 * nnodes * (k + 1)].cast('I') for k in range(3)]
+        start += 12 * nnodes
+        self._slots = view[start:start + 4 * nslots].cast('I')
+        start += 4 * nslots
+        self._keys = view[start:start + nbytes]
+        start += nbytes + (-(start + nbytes) % 8)
+        self.pair_keys = view[start:start + 8 * npairs].cast('q')
+        start += 8 * npairs
+        self.pair_logprobs = view[start:start + 8 * npairs].cast('d')
+
+    def __len__(self):
+        return self._n
+
+    def _node(self, key_bytes):
+        """Get the node of the prefix key_bytes, or -1 if no key starts with it"""
+        size = len(key_bytes)
+        h = _slot(key_bytes, self._mask)
+        slot = self._slots[h]
+        while slot:
+            node = slot - 1
+            if self._nbytes[node] == size:
+                start = self._offsets[self._lo[node]]
+                if self._keys[start:start + size] == key_bytes:
+                    return node
+            h = (h + 1) & self._mask
+            slot = self._slots[h]
+        return -1
+
+    def index(self, key):
+        """Get the position of key in sorted order, or -1 if it is not in the table"""
+        return self.prefix(key)[0]
+
+    def prefix(self, key):
+        """Get (position of key or -1, whether longer keys start with key), so walking
+        the characters of a text can stop as soon as no key starts with them"""
+        node = self._node(key.encode('utf-8'))
+        if node < 0:
+            return (-1, False)
+        (lo, hi) = (self._lo[node], self._hi[node])
+        if self._offsets[lo + 1] - self._offsets[lo] == self._nbytes[node]:
+            return (lo, hi - lo > 1)
+        return (-1, True)
+
+    def key(self, index):
+        return bytes(self._keys[self._offsets[index]:self._offsets[index + 1]]).decode('utf-8')
+
+    def value(self, index):
+        return self._counts[index]
+
+    def close(self):
+        for view in [self._counts, self._offsets, self._lo, self._hi, self._nbytes, self._slots, self._keys, self.pair_keys, self.pair_logprobs] + self._views:
+            view.release()
+        self._mmap.close()
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description="compile count files into a memory mapped count table")
+    argparser.add_argument("inputs", nargs='+', help="tab separated count files, counts of repeated keys are summed")
+    argparser.add_argument("-o", "--output", dest='output', type=str, required=True, help="compiled output file (*%s)" % SUFFIX)
+    argparser.add_argument("--mincount", dest='mincount', type=int, default=1, help="drop keys counted fewer times")
+    argparser.add_argument("--topn", dest='topn', type=int, default=None, help="only keep the topn most frequent keys")
+    argparser.add_argument("--quantize", dest='bits', type=int, default=0, choices=[0, 8, 16], help="store log probabilities as 8 or 16 bit codes")
+    argparser.add_argument("--unigrams", dest='unigrams', type=str, default=None, help="compiled unigram file, for bigram counts: also store the bigram log probabilities by word id pair of this file")
+    args = argparser.parse_args()
+
+    counts = read_counts(args.inputs)
+    kept = prune_counts(counts, args.mincount, args.topn)
+    unigrams = CountTable(args.unigrams) if args.unigrams else None
+    write_counts(kept, args.output, sum(counts.values()), len(counts), args.bits, unigrams)
+    sys.stderr.write("%d of %d keys written to %s (%d bytes)\n" % (len(kept), len(counts), args.output, os.path.getsize(args.output)))
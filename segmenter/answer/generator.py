@@ -2,43 +2,140 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sys
+import heapq
 import argparse
+import tempfile
+import itertools
+import multiprocessing
+from operator import itemgetter
+from collections import Counter
 
 # arguments
 argparser = argparse.ArgumentParser()
-argparser.add_argument("--input", dest='input', type=str, default=os.path.join('data', 'wseg_simplified_cn.txt'), help="input file")
+argparser.add_argument("--input", dest='inputs', type=str, nargs='+', default=[os.path.join('data', 'wseg_simplified_cn.txt')], help="input files, one segmented sentence per line")
 argparser.add_argument("--output1w", dest='output1w', type=str, default=os.path.join('data', 'count_1w_extra.txt'), help="output file")
 argparser.add_argument("--output2w", dest='output2w', type=str, default=os.path.join('data', 'count_2w_extra.txt'), help="output file")
-args = argparser.parse_args()
+argparser.add_argument("--append", dest='append', action='store_true', default=False, help="add the counts to the existing output files instead of replacing them")
+argparser.add_argument("--workers", dest='workers', type=int, default=1, help="number of processes counting shards of the corpus")
+argparser.add_argument("--budget", dest='budget', type=int, default=1000000, help="number of keys a worker holds in memory before spilling them to a sorted run on disk")
+argparser.add_argument("--fanin", dest='fanin', type=int, default=64, help="number of sorted runs merged at a time")
+argparser.add_argument("--tmpdir", dest='tmpdir', type=str, default=None, help="directory for the sorted runs")
 
-dict1w = {}
-dict2w = {}
 
-for line in open(args.input, 'r'):
-    words = line.split()
-    words = [word.strip() for word in words]
+def write_run(counts, tmpdir):
+    """Write counts sorted by key to a temporary file and return its name"""
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=tmpdir, suffix='.run', delete=False) as run:
+        for key in sorted(counts):
+            run.write('%s\t%d\n' % (key, counts[key]))
+    return run.name
 
-    prev = '<S>'
 
-    for word in words:
-        if word in dict1w:
-            dict1w[word] += 1
-        else:
-            dict1w[word] = 1
+def read_run(filename, sep='\t'):
+    for line in open(filename, 'r', encoding='utf-8'):
+        (key, count) = line.rstrip('\n').rsplit(sep, 1)
+        yield (key, int(count))
 
-        if (prev, word) in dict2w:
-            dict2w[(prev, word)] += 1
-        else:
-            dict2w[(prev, word)] = 1
-        prev = word
 
+def shards(filename, n):
+    """Split filename into n byte ranges of about the same size"""
+    size = os.path.getsize(filename)
+    step = max(1, -(-size // n))
+    return [(filename, start, min(start + step, size)) for start in range(0, size, step)]
 
-output1w = open(args.output1w, 'w')
-for word, count in dict1w.items():
-    output1w.write('%s\t%d\n' % (word, count))
-output1w.close()
 
-output2w = open(args.output2w, 'w')
-for (word1, word2), count in dict2w.items():
-    output2w.write('%s %s\t%d\n' % (word1, word2, count))
-output2w.close()
+def count_shard(filename, start, end, budget, tmpdir):
+    """Count the words and word pairs of the lines starting in [start, end) of filename,
+    and return the sorted runs of unigram and bigram counts"""
+    dict1w = Counter()
+    dict2w = Counter()
+    runs1w = []
+    runs2w = []
+    with open(filename, 'rb') as f:
+        # a line belongs to the shard its first byte is in
+        if start > 0:
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            prev = '<S>'
+            for word in line.decode('utf-8').split():
+                dict1w[word] += 1
+                dict2w[prev + ' ' + word] += 1
+                prev = word
+            if len(dict1w) + len(dict2w) > budget:
+                runs1w.append(write_run(dict1w, tmpdir))
+                runs2w.append(write_run(dict2w, tmpdir))
+                dict1w.clear()
+                dict2w.clear()
+    runs1w.append(write_run(dict1w, tmpdir))
+    runs2w.append(write_run(dict2w, tmpdir))
+    return (runs1w, runs2w)
+
+
+def existing_runs(filename, budget, tmpdir):
+    """Split an existing count file into sorted runs, so it can be merged with new counts"""
+    runs = []
+    if not os.path.exists(filename):
+        return runs
+    counts = Counter()
+    for (key, count) in read_run(filename):
+        counts[key] += count
+        if len(counts) > budget:
+            runs.append(write_run(counts, tmpdir))
+            counts.clear()
+    runs.append(write_run(counts, tmpdir))
+    return runs
+
+
+def merge_runs(runs, output):
+    """Merge sorted runs with a heap, summing the counts of equal keys, into output"""
+    merged = heapq.merge(*[read_run(run) for run in runs], key=itemgetter(0))
+    with open(output, 'w', encoding='utf-8') as out:
+        for key, group in itertools.groupby(merged, key=itemgetter(0)):
+            out.write('%s\t%d\n' % (key, sum(count for _, count in group)))
+    return output
+
+
+def merge_all(runs, output, fanin, tmpdir):
+    """Merge the runs into output, at most fanin files at a time. runs always lists
+    the run files on disk, the merged ones replacing their inputs, so the caller can
+    remove them if a merge fails"""
+    while len(runs) > fanin:
+        group = runs[:fanin]
+        (fd, merged) = tempfile.mkstemp(suffix='.run', dir=tmpdir)
+        os.close(fd)
+        runs.append(merged)
+        merge_runs(group, merged)
+        for run in group:
+            os.remove(run)
+            runs.remove(run)
+    merge_runs(runs, output)
+
+
+if __name__ == '__main__':
+    args = argparser.parse_args()
+
+    runs1w = existing_runs(args.output1w, args.budget, args.tmpdir) if args.append else []
+    runs2w = existing_runs(args.output2w, args.budget, args.tmpdir) if args.append else []
+
+    tasks = [shard + (args.budget // max(1, args.workers), args.tmpdir) for filename in args.inputs for shard in shards(filename, args.workers)]
+    if args.workers > 1:
+        with multiprocessing.Pool(args.workers) as pool:
+            results = pool.starmap(count_shard, tasks)
+    else:
+        results = [count_shard(*task) for task in tasks]
+    for shard_runs1w, shard_runs2w in results:
+        runs1w.extend(shard_runs1w)
+        runs2w.extend(shard_runs2w)
+
+    sys.stderr.write("merging %d sorted runs into %s and %s\n" % (len(runs1w) + len(runs2w), args.output1w, args.output2w))
+    try:
+        merge_all(runs1w, args.output1w, args.fanin, args.tmpdir)
+        merge_all(runs2w, args.output2w, args.fanin, args.tmpdir)
+    finally:
+        for run in runs1w + runs2w:
+            if os.path.exists(run):
+                os.remove(run)
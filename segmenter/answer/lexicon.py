@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+class Lexicon(object):
+    """The words of a probability distribution, enumerated by probing it character by
+    character. Nothing is built up front, the distribution's prefix(word) gives the id
+    of word (None if unknown) and whether longer known words start with it"""
+    def __init__(self, prob_dist):
+        self.prob_dist = prob_dist
+
+    def prefixes(self, chars, start, maxlen):
+        """Yield (length, id) for every known word of at most maxlen characters starting at chars[start]"""
+        prefix = self.prob_dist.prefix
+        word = ''
+        for end in range(start, min(start + maxlen, len(chars))):
+            word += chars[end]
+            (word_id, extends) = prefix(word)
+            if word_id is not None:
+                yield (end - start + 1, word_id)
+            if not extends:
+                return
+
+    def words_by_end(self, chars, maxlen):
+        """For every position i, map the length of each known word ending at chars[i] to its id"""
+        ends = [{} for _ in chars]
+        for start in range(len(chars)):
+            for length, word_id in self.prefixes(chars, start, maxlen):
+                ends[start + length - 1][length] = word_id
+        return ends
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import argparse
+import itertools
+import subprocess
+
+# arguments, anything else is passed on to bench.py and segment.py
+argparser = argparse.ArgumentParser(description="report the F-score and memory impact of pruning and quantizing the count files, run from the segmenter directory")
+argparser.add_argument("--mincounts", dest='mincounts', type=int, nargs='+', default=[1, 2, 5], help="--mincount values to try")
+argparser.add_argument("--topns", dest='topns', type=int, nargs='+', default=[None], help="--topn values to try")
+argparser.add_argument("--quantize", dest='quantize', type=int, nargs='+', default=[0, 8, 16], choices=[0, 8, 16], help="--quantize values to try")
+argparser.add_argument("--output", dest='output', type=str, default=None, help="write the results as json to this file")
+
+
+def bench(setting, extra_args):
+    """Run bench.py with the pruning setting and return its results"""
+    (mincount, topn, bits) = setting
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench.py'), '--mincount', str(mincount), '--quantize', str(bits)]
+    if topn is not None:
+        command += ['--topn', str(topn)]
+    child = subprocess.run(command + extra_args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, check=True)
+    return json.loads(child.stdout)['results']
+
+
+if __name__ == '__main__':
+    (opts, extra_args) = argparser.parse_known_args()
+
+    report = []
+    baseline = {}
+    print("mode\tmincount\ttopn\tbits\tunigrams\tbigrams\tpeak_rss_kb\tF\tdelta_F")
+    for setting in itertools.product(opts.mincounts, opts.topns, opts.quantize):
+        for result in bench(setting, extra_args):
+            # the first setting is the baseline of each mode
+            baseline.setdefault(result['mode'], result['fscore'])
+            delta = result['fscore'] - baseline[result['mode']]
+            print("%s\t%d\t%s\t%d\t%d\t%d\t%d\t%.2f\t%+.2f" % ((result['mode'],) + setting + (
+                result['unigram_entries'], result['bigram_entries'], result['peak_rss_kb'], result['fscore'], delta)))
+            sys.stdout.flush()
+            report.append(dict(zip(('mincount', 'topn', 'bits'), setting), delta_fscore=delta, **result))
+    if opts.output:
+        with open(opts.output, 'w') as out:
+            json.dump(report, out, indent=2)
@@ -2,164 +2,622 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sys
 import math
+import heapq
+import bisect
 import argparse
+import operator
+import itertools
+import collections
+import multiprocessing
+import countstore
+from cache import LRUCache, fingerprint
+from lexicon import Lexicon
 
 # arguments
 argparser = argparse.ArgumentParser()
-argparser.add_argument("--unigramcounts", dest='counts1w', type=list, nargs='+', default=[os.path.join('data', 'count_1w.txt')], help="unigram counts")
-argparser.add_argument("--bigramcounts", dest='counts2w', type=list, nargs='+', default=[os.path.join('data', 'count_2w.txt')], help="bigram counts")
+argparser.add_argument("--unigramcounts", dest='counts1w', type=str, nargs='+', default=[os.path.join('data', 'count_1w.txt')], help="unigram counts")
+argparser.add_argument("--bigramcounts", dest='counts2w', type=str, nargs='+', default=[os.path.join('data', 'count_2w.txt')], help="bigram counts")
 argparser.add_argument("--inputfile", dest="input", type=str, default=os.path.join('data', 'input'), help="input file to segment")
 argparser.add_argument("--maxlen", dest ='maxlen', type=int, default=10, help="max possible length for unknown word")
 argparser.add_argument("--smooth", dest ='smooth', type=float, default=0.0245, help="smoothing parameter")
+argparser.add_argument("--mincount", dest='mincount', type=int, default=1, help="drop the count file entries counted fewer times")
+argparser.add_argument("--topn", dest='topn', type=int, default=None, help="only keep the topn most frequent entries of each count file")
+argparser.add_argument("--quantize", dest='quantize', type=int, default=0, choices=[0, 8, 16], help="store log probabilities as 8 or 16 bit codes")
 argparser.add_argument("--unigram", dest ='enable_unigram', action='store_true', default=False, help="the flag that enable the unigram method")
+argparser.add_argument("--beam", dest='beam', type=int, default=None, help="number of previous words kept per position by the bigram method (default: all)")
+argparser.add_argument("--nbest", dest='nbest', type=int, default=None, help="output the k best segmentations of each line as 'line ||| segmentation ||| score'")
+argparser.add_argument("--lattice", dest='lattice', type=float, default=None, help="output the word lattice of each line, pruned to the words on a path within LATTICE of the best score")
+argparser.add_argument("--batch", dest='batch', action='store_true', default=False, help="segment each chunk of lines as one batch with numpy (unigram method only)")
+argparser.add_argument("--workers", dest='workers', type=int, default=1, help="number of worker processes, the count tables are shared with them by fork")
+argparser.add_argument("--chunksize", dest='chunksize', type=int, default=256, help="number of lines sent to a worker at a time")
+argparser.add_argument("--cachesize", dest='cachesize', type=int, default=10000, help="number of segmented lines kept in an LRU cache, 0 disables it")
+argparser.add_argument("--cachefile", dest='cachefile', type=str, default=None, help="persistent on-disk cache of segmented lines, shared across runs")
 argparser.add_argument("--log", dest='enable_log', action='store_true', default=False, help="the flag that enable the log print")
-args = argparser.parse_args()
+# when imported, e.g. by bench.py, use the defaults until the importer sets args
+args = argparser.parse_args() if __name__ == "__main__" else argparser.parse_args([])
 
 
-class ProbDist(dict):
-    """A probability distribution estimated from counts in datafile."""
-    def __init__(self, filenames, sep='\t'):
-        for filename in filenames:
-            for line in open(filename, 'r'):
-                (key, freq) = line.split(sep)
-                self[key] = self.get(key, 0) + int(freq)
-        self.totalvalue = float(sum(self.values()))
-        self.totaltype = float(len(self))
+class LengthPenalty(object):
+    """Unknown word model where the probability of a word only depends on its length,
+    falling by a factor of smooth * i * total for the i-th extra character.
+    An unknown word model scores spans of the characters of a line, any object with
+    the same prob(chars, start, length, total) and logprobs(chars, maxlen, total)
+    methods, e.g. a character bigram model, can be passed to ProbDist instead."""
+    def __init__(self, smooth=0.0245, maxlen=10):
+        self.smooth = smooth
+        self.maxlen = maxlen
+        # probabilities by total, and log probability tables by (maxlen, total)
+        self.tables = {}
+        self.logtables = {}
+
+    def prob(self, chars, start, length, total):
+        """Probability of the unknown word chars[start:start + length]"""
+        return self.cached_probs(total, length)[length]
+
+    def logprobs(self, chars, maxlen, total):
+        """logprobs[i][j] is the log probability of the unknown word of length j ending
+        at chars[i], for j up to maxlen. Only the length matters here, so every position
+        shares one table, computed once"""
+        table = self.logtables.get((maxlen, total))
+        if table is None:
+            table = self.logtables[maxlen, total] = [math.log(prob) for prob in self.cached_probs(total, maxlen)[:maxlen + 1]]
+        return [table] * len(chars)
+
+    def cached_probs(self, total, maxlen):
+        """probs(total) covering at least maxlen, computed again only for a longer word"""
+        probs = self.tables.get(total)
+        if probs is None or len(probs) <= maxlen:
+            probs = self.tables[total] = self.probs(total, max(maxlen, self.maxlen))
+        return probs
+
+    def probs(self, total, maxlen=None):
+        """Probabilities of an unknown word for every length up to maxlen, in one pass"""
+        maxlen = self.maxlen if maxlen is None else maxlen
+        score = 1. / total
+        probs = [score, score]
+        for i in range(1, maxlen):
+            score = score / (self.smooth * i * total)
+            probs.append(score + 1e-200) # avoid log(0)
+        return probs[:maxlen + 1]
 
+
+class BaseProbDist(object):
+    """The probabilities shared by ProbDist and MappedProbDist, which supply the
+    mapping from keys to counts, totalvalue, totaltype and logprobs"""
     def __call__(self, key):
         """Get probability for this key"""
         if key not in self:
-            return self._smoothing_func(key)
+            return self.unknown.prob(key, 0, len(key), self.totalvalue)
         else:
             return float(self[key]) / self.totalvalue
 
-    def _smoothing_func(self, key):
-        """Better smoothing function"""
-        if len(key) <= 1:
-            return 1. / self.totalvalue
-        else:
-            score = 1. / self.totalvalue
-            for i in range(1, len(key)):
-                score = score / (args.smooth * i * self.totalvalue)
-            return score + 1e-200
+    def _set_unknown(self, unknown):
+        self.unknown = unknown if unknown is not None else LengthPenalty()
+
+    def unknown_logprobs(self, chars, maxlen):
+        """unknown_logprobs[i][j] is the log probability of the characters of length j
+        ending at chars[i] as an unknown word, see LengthPenalty.logprobs"""
+        return self.unknown.logprobs(chars, maxlen, self.totalvalue)
 
     def count(self, key):
         """Get count number for this key"""
         return self.get(key, 0)
 
 
+class ProbDist(BaseProbDist, dict):
+    """A probability distribution estimated from counts in datafile."""
+    def __init__(self, filenames, sep='\t', mincount=1, topn=None, bits=0, unknown=None):
+        for filename in filenames:
+            for line in open(filename, 'r'):
+                (key, freq) = line.split(sep)
+                self[key] = self.get(key, 0) + int(freq)
+        self.totalvalue = float(sum(self.values()))
+        self.totaltype = float(len(self))
+        # pruned keys become unknown words, the totals are kept so the
+        # probabilities of the remaining keys do not change
+        if mincount > 1 or topn is not None:
+            kept = countstore.prune_counts(self, mincount, topn)
+            self.clear()
+            self.update(kept)
+        self.ids = {key: i for i, key in enumerate(self)}
+        self.proper_prefixes = None
+        self.logprobs = [math.log(float(self[key]) / self.totalvalue) for key in self.ids]
+        if bits:
+            self.logprobs = countstore.QuantizedArray(*countstore.quantize(self.logprobs, bits))
+        self._set_unknown(unknown)
+
+    def word_id(self, key):
+        """Get the id of this key, an index into logprobs, or None if it is unknown"""
+        return self.ids.get(key)
+
+    def prefix(self, key):
+        """Get (id of key or None, whether longer keys start with key), see lexicon.py"""
+        if self.proper_prefixes is None:
+            # built on first use, so the bigram counts, which are never walked, do not pay for it
+            self.proper_prefixes = {word[:length] for word in self.ids for length in range(1, len(word))}
+        return (self.ids.get(key), key in self.proper_prefixes)
+
+
+class MappedProbDist(BaseProbDist):
+    """A probability distribution backed by a compiled count file, see countstore.py;
+    a read-only mapping of the keys to their counts, no values() or items() copies"""
+    def __init__(self, filename, unknown=None):
+        self.table = countstore.CountTable(filename)
+        self.totalvalue = self.table.totalvalue
+        self.totaltype = self.table.totaltype
+        self.logprobs = self.table.logprobs
+        self._set_unknown(unknown)
+
+    def __contains__(self, key):
+        return self.table.index(key) >= 0
+
+    def __getitem__(self, key):
+        index = self.table.index(key)
+        if index < 0:
+            raise KeyError(key)
+        return self.table.value(index)
+
+    def __len__(self):
+        return len(self.table)
+
+    def __iter__(self):
+        return (self.table.key(i) for i in range(len(self.table)))
+
+    def keys(self):
+        return iter(self)
+
+    def get(self, key, default=None):
+        index = self.table.index(key)
+        return self.table.value(index) if index >= 0 else default
+
+    def word_id(self, key):
+        index = self.table.index(key)
+        return index if index >= 0 else None
+
+    def prefix(self, key):
+        (index, extends) = self.table.prefix(key)
+        return (index if index >= 0 else None, extends)
+
+
+def load_prob_dist(filenames, mincount=1, topn=None, bits=0, unknown=None):
+    """Load a compiled count file if one is given, otherwise parse the count files,
+    unknown is the unknown word model (default: LengthPenalty())"""
+    if len(filenames) == 1 and filenames[0].endswith(countstore.SUFFIX):
+        if mincount > 1 or topn is not None or bits:
+            raise ValueError("compiled count files are pruned and quantized when they are compiled, see countstore.py")
+        return MappedProbDist(filenames[0], unknown)
+    return ProbDist(filenames, mincount=mincount, topn=topn, bits=bits, unknown=unknown)
+
+
+class BigramDist(dict):
+    """Laplacian bigram log probabilities keyed by word id pairs, see key()"""
+    def __init__(self, prob_dist2, prob_dist):
+        self.size = len(prob_dist)
+        for word_pair in prob_dist2.keys():
+            (word1, word2) = word_pair.split(' ')
+            id1 = prob_dist.word_id(word1)
+            id2 = prob_dist.word_id(word2)
+            # pairs with a word outside the unigram lexicon are never candidates
+            if id1 is None or id2 is None:
+                continue
+            self[self.key(id1, id2)] = math.log((prob_dist2.count(word_pair) + 1) / (prob_dist.count(word1) + prob_dist.totaltype))
+
+    def key(self, id1, id2):
+        return id1 * self.size + id2
+
+
+class MappedBigramDist(object):
+    """The log probabilities of BigramDist read from a bigram count file compiled with
+    --unigrams, see countstore.py; get() is a binary search over the mapped keys"""
+    def __init__(self, table, size):
+        self.size = size
+        self.keys = table.pair_keys
+        self.logprobs = table.pair_logprobs
+
+    def __len__(self):
+        return len(self.keys)
+
+    def key(self, id1, id2):
+        return id1 * self.size + id2
+
+    def get(self, key, default=None):
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return self.logprobs[i]
+        return default
+
+
+def load_bigram_dist(prob_dist2, prob_dist):
+    """Use the bigram log probabilities of a compiled bigram count file when they were
+    compiled against the unigram count file in use, otherwise compute them"""
+    if isinstance(prob_dist2, MappedProbDist) and isinstance(prob_dist, MappedProbDist):
+        if prob_dist2.table.pair_checksum == prob_dist.table.checksum:
+            return MappedBigramDist(prob_dist2.table, len(prob_dist))
+        sys.stderr.write("the bigram count file was not compiled with --unigrams and this unigram file, computing its log probabilities\n")
+    return BigramDist(prob_dist2, prob_dist)
+
+
 class Unigram(object):
     """Unigram method to segment the sentense"""
-    def __init__(self, input_words, prob_dist):
+    def __init__(self, input_words, prob_dist, lexicon, maxlen=10, log=False):
         self.input_words = input_words
         self.prob_dist = prob_dist
+        self.lexicon = lexicon
+        self.maxlen = maxlen
+        self.log = log
+        # unknown[i][j] scores the characters of length j ending at i as an unknown word
+        self.unknown = prob_dist.unknown_logprobs(input_words, maxlen)
         self.chart = {} # the dynamic programming table to store the argmax for every prefix of input
 
     def segment(self):
+        """Return the best segmentation as a list of words"""
+        # known words are enumerated by walking the lexicon, every other
+        # span is scored by the unknown word model
+        known = self.lexicon.words_by_end(self.input_words, self.maxlen)
+        logprobs = self.prob_dist.logprobs
+        unknown = self.unknown
         for i in range(len(self.input_words)):
-            for j in range(1, args.maxlen + 1):
-                if i - j + 1 < 0:
-                    continue
-                word = "".join(self.input_words[i-j+1:i+1])
-                prob = math.log(self.prob_dist(word))
+            for j in range(1, min(self.maxlen, i + 1) + 1):
+                word_id = known[i].get(j)
+                prob = logprobs[word_id] if word_id is not None else unknown[i][j]
                 prev_prob = self.chart[i - j][1] if i - j >=0 else 0
-                if args.enable_log:
-                    print("==> Check: ", i, j, word, prob, prev_prob)
+                if self.log:
+                    print("==> Check: ", i, j, "".join(self.input_words[i-j+1:i+1]), prob, prev_prob)
                 if i not in self.chart or (prev_prob + prob) > self.chart[i][1]:
-                    self.chart[i] = (word, prev_prob + prob)
-                    if args.enable_log:
-                        print("==> Update: ", i, word, prev_prob + prob)
+                    self.chart[i] = (j, prev_prob + prob)
+                    if self.log:
+                        print("==> Update: ", i, "".join(self.input_words[i-j+1:i+1]), prev_prob + prob)
 
         # get the best segmentation
         index = len(self.input_words) - 1
         result = []
         while index >= 0:
-            word, _ = self.chart[index]
-            result.append(word)
-            index -= len(word)
+            length, _ = self.chart[index]
+            result.append("".join(self.input_words[index-length+1:index+1]))
+            index -= length
         result.reverse()
-        print(" ".join(result))
+        return result
+
+    def _logprob(self, known, i, j):
+        """Log probability of the word of length j ending at i"""
+        word_id = known[i].get(j)
+        return self.prob_dist.logprobs[word_id] if word_id is not None else self.unknown[i][j]
+
+    def nbest(self, k):
+        """Return the k best segmentations as (score, list of words), best first"""
+        n = len(self.input_words)
+        known = self.lexicon.words_by_end(self.input_words, self.maxlen)
+        # kbest[b] holds the k best (score, length of the last word, rank of the
+        # segmentation before it) of the first b characters
+        kbest = [[(0.0, 0, 0)]]
+        for b in range(1, n + 1):
+            candidates = []
+            for j in range(1, min(self.maxlen, b) + 1):
+                prob = self._logprob(known, b - 1, j)
+                for rank, (score, _, _) in enumerate(kbest[b - j]):
+                    candidates.append((score + prob, j, rank))
+            kbest.append(heapq.nlargest(k, candidates, key=operator.itemgetter(0)))
+
+        result = []
+        for rank, (score, _, _) in enumerate(kbest[n]):
+            words = []
+            b = n
+            while b > 0:
+                _, length, rank = kbest[b][rank]
+                words.append("".join(self.input_words[b-length:b]))
+                b -= length
+            words.reverse()
+            result.append((score, words))
+        return result
+
+    def lattice(self, beam):
+        """Return (start, end, score) for every word on a segmentation scoring within beam
+        of the best one, score is the best score of a segmentation using the word"""
+        self.segment()
+        n = len(self.input_words)
+        known = self.lexicon.words_by_end(self.input_words, self.maxlen)
+        # best scores of the first and of the last b characters
+        forward = [0.0] + [self.chart[i][1] for i in range(n)]
+        backward = [0.0] * (n + 1)
+        for b in range(n - 1, -1, -1):
+            backward[b] = max(self._logprob(known, b + j - 1, j) + backward[b + j] for j in range(1, min(self.maxlen, n - b) + 1))
+
+        arcs = []
+        for end in range(1, n + 1):
+            for j in range(1, min(self.maxlen, end) + 1):
+                score = forward[end - j] + self._logprob(known, end - 1, j) + backward[end]
+                if score >= backward[0] - beam:
+                    arcs.append((end - j, end, score))
+        return arcs
 
 
 class Bigram(object):
     """Bigram method to segment the sentense"""
-    def __init__(self, input_words, prob_dist, prob_dist2):
+    def __init__(self, input_words, prob_dist, bigram_dist, lexicon, beam=None, maxlen=10, log=False):
         self.input_words = input_words
         self.prob_dist = prob_dist
-        self.prob_dist2 = prob_dist2
-        self.chart = {} # the dynamic programming table to store the argmax for every prefix of input
+        self.bigram_dist = bigram_dist
+        self.lexicon = lexicon
+        self.beam = beam # number of previous words kept for each position, None keeps all
+        self.maxlen = maxlen
+        self.log = log
+        # unknown[i][j] scores the characters of length j ending at i as an unknown word
+        self.unknown = prob_dist.unknown_logprobs(input_words, maxlen)
+        # the dynamic programming table, chart[i * width + j] is the best score of
+        # a segmentation whose last word has length j and ends at i, and
+        # backpointer[i] is the length of the best scoring word ending at i
+        self.width = maxlen + 1
+        self.chart = [-math.inf] * (len(input_words) * self.width)
+        self.backpointer = [0] * len(input_words)
 
-    def get_probability(self, word1, word2):
-        word_pair = word1 + ' ' + word2
-        if word_pair in self.prob_dist2 and word1 in self.prob_dist:
+    def get_probability(self, id1, id2, end, length):
+        """id1 and id2 are None for words not in the lexicon, the second word has this length and ends at end"""
+        # Backoff
+        prob = self.prob_dist.logprobs[id2] if id2 is not None else self.unknown[end][length]
+        if id1 is not None and id2 is not None:
             # Laplacian bigram probabilities
-            return math.log((self.prob_dist2.count(word_pair) + 1) / (self.prob_dist.count(word1) + self.prob_dist.totaltype))
-        else:
-            # Backoff
-            return math.log(self.prob_dist(word2))
+            prob = self.bigram_dist.get(self.bigram_dist.key(id1, id2), prob)
+        return prob
+
+    def _close_row(self, i):
+        """Set the backpointer of position i once all words ending there are scored,
+        and return the lengths of the words ending at i that later words extend"""
+        chart = self.chart
+        row = i * self.width
+        # ties go to the word spanning the whole prefix, then to the shortest word
+        order = ([i + 1] if i < self.maxlen else []) + list(range(1, min(self.maxlen, i) + 1))
+        best = order[0]
+        for j in order:
+            if chart[row + j] > chart[row + best]:
+                best = j
+        self.backpointer[i] = best
+
+        lengths = [k for k in range(1, min(self.maxlen, i + 1) + 1) if chart[row + k] > -math.inf]
+        if self.beam is not None and len(lengths) > self.beam:
+            lengths = sorted(lengths, key=lambda k: -chart[row + k])[:self.beam]
+            lengths.sort()
+        return lengths
 
     def segment(self):
-        for i in range(args.maxlen):
-            word1 = "<S>"
-            word2 = "".join(self.input_words[:i+1])
-            prob = self.get_probability(word1, word2)
-            self.chart[(i, len(word2))] = (word2, prob)
-
-        for i in range(1, len(self.input_words)):
-            for j in range(1, args.maxlen + 1):
-                if i - j + 1 < 0:
-                    continue
-                for k in range(1, args.maxlen + 1):
-                    if i - j - k + 1 < 0:
-                        continue
-                    word1 = "".join(self.input_words[i-j-k+1:i-j+1])
-                    word2 = "".join(self.input_words[i-j+1:i+1])
-                    prob = self.get_probability(word1, word2)
-                    prev_prob = self.chart[(i - j, k)][1]
-                    if args.enable_log:
-                        print("==> Check: ", i - j, k, word1, word2, prob, prev_prob)
-                    if (i, j) not in self.chart or (prev_prob + prob) > self.chart[(i, j)][1]:
-                        self.chart[(i, j)] = (word2, prev_prob + prob)
-                        if args.enable_log:
-                            print("==> Update: ", i, j, word2, prev_prob + prob)
+        """Return the best segmentation as a list of words"""
+        n = len(self.input_words)
+        if n == 0:
+            return []
+        known = self.lexicon.words_by_end(self.input_words, self.maxlen)
+        start_id = self.prob_dist.word_id("<S>")
+        chart = self.chart
+        width = self.width
+        for i in range(min(self.maxlen, n)):
+            chart[i * width + i + 1] = self.get_probability(start_id, known[i].get(i + 1), i, i + 1)
 
-        # get the best segmentation
-        best_chart = {}
-        for (i, j) in self.chart.keys():
-            if i not in best_chart or best_chart[i][1] < self.chart[(i, j)][1]:
-                best_chart[i] = self.chart[(i, j)]
+        logprobs = self.prob_dist.logprobs
+        unknown = self.unknown
+        bigrams = self.bigram_dist
+        size = bigrams.size
+        previous = [self._close_row(0)]
+        for i in range(1, n):
+            row = i * width
+            for j in range(1, min(self.maxlen, i) + 1):
+                id2 = known[i].get(j)
+                backoff = logprobs[id2] if id2 is not None else unknown[i][j]
+                prev_row = (i - j) * width
+                prev_known = known[i - j]
+                best_prob = -math.inf
+                for k in previous[i - j]:
+                    # inlined get_probability
+                    id1 = prev_known.get(k)
+                    if id1 is not None and id2 is not None:
+                        prob = bigrams.get(id1 * size + id2, backoff)
+                    else:
+                        prob = backoff
+                    prev_prob = chart[prev_row + k]
+                    if self.log:
+                        print("==> Check: ", i - j, k, "".join(self.input_words[i-j-k+1:i-j+1]), "".join(self.input_words[i-j+1:i+1]), prob, prev_prob)
+                    if prev_prob + prob > best_prob:
+                        best_prob = prev_prob + prob
+                        if self.log:
+                            print("==> Update: ", i, j, "".join(self.input_words[i-j+1:i+1]), best_prob)
+                chart[row + j] = best_prob
+            previous.append(self._close_row(i))
 
-        index = len(self.input_words) - 1
+        # get the best segmentation
+        backpointer = self.backpointer
+        index = n - 1
         result = []
         while index >= 0:
-            word, _ = best_chart[index]
-            result.append(word)
-            index -= len(word)
+            length = backpointer[index]
+            result.append("".join(self.input_words[index-length+1:index+1]))
+            index -= length
         result.reverse()
-        print(" ".join(result))
+        return result
 
+    def nbest(self, k):
+        """Return the k best segmentations as (score, list of words), best first.
+        These are exact path scores, so the best one can differ from segment(),
+        which reads off the best word ending at each position"""
+        n = len(self.input_words)
+        if n == 0:
+            return [(0.0, [])]
+        known = self.lexicon.words_by_end(self.input_words, self.maxlen)
+        start_id = self.prob_dist.word_id("<S>")
+        # kbest[e][j] holds the k best (score, length of the previous word, rank of
+        # its segmentation) of the first e characters ending with a word of length j
+        kbest = [[[] for _ in range(self.width)] for _ in range(n + 1)]
+        for e in range(1, n + 1):
+            for j in range(1, min(self.maxlen, e) + 1):
+                id2 = known[e - 1].get(j)
+                if j == e:
+                    kbest[e][j] = [(self.get_probability(start_id, id2, e - 1, j), 0, 0)]
+                    continue
+                candidates = []
+                for l in range(1, min(self.maxlen, e - j) + 1):
+                    prob = self.get_probability(known[e - j - 1].get(l), id2, e - 1, j)
+                    for rank, (score, _, _) in enumerate(kbest[e - j][l]):
+                        candidates.append((score + prob, l, rank))
+                kbest[e][j] = heapq.nlargest(k, candidates, key=operator.itemgetter(0))
 
-if __name__ == "__main__":
+        final = [(score, j, rank) for j in range(1, min(self.maxlen, n) + 1) for rank, (score, _, _) in enumerate(kbest[n][j])]
+        result = []
+        for score, j, rank in heapq.nlargest(k, final, key=operator.itemgetter(0)):
+            words = []
+            e = n
+            while e > 0:
+                words.append("".join(self.input_words[e-j:e]))
+                _, l, rank = kbest[e][j][rank]
+                e, j = e - j, l
+            words.reverse()
+            result.append((score, words))
+        return result
+
+    def lattice(self, beam):
+        """Return (start, end, score) for every word on a segmentation scoring within beam
+        of the best one, score is the best score of a segmentation using the word"""
+        self.segment()
+        n = len(self.input_words)
+        known = self.lexicon.words_by_end(self.input_words, self.maxlen)
+        width = self.width
+        # backward[e * width + j] is the best score of the rest of the line after
+        # the word of length j ending at the e-th character
+        backward = [0.0] * ((n + 1) * width)
+        for e in range(n - 1, 0, -1):
+            for j in range(1, min(self.maxlen, e) + 1):
+                id1 = known[e - 1].get(j)
+                backward[e * width + j] = max(self.get_probability(id1, known[e + l - 1].get(l), e + l - 1, l) + backward[(e + l) * width + l]
+                                              for l in range(1, min(self.maxlen, n - e) + 1))
+
+        arcs = []
+        for e in range(1, n + 1):
+            for j in range(1, min(self.maxlen, e) + 1):
+                arcs.append((e - j, e, self.chart[(e - 1) * width + j] + backward[e * width + j]))
+        if not arcs:
+            return []
+        best = max(score for _, _, score in arcs)
+        return [arc for arc in arcs if arc[2] >= best - beam]
+
+
+def make_segmenter(line):
+    """Build the segmenter selected on the command line for one line, with the models loaded in __main__"""
+    # init input words list
+    input_words = [i for i in line.strip()]
+    if args.enable_log:
+        print("==> Input words: ", input_words, len(input_words))
+
+    if not args.enable_unigram:
+        # the bigram method
+        return Bigram(input_words, prob_dist, bigram_dist, lexicon, args.beam, args.maxlen, args.enable_log)
+    else:
+        # the unigram method
+        return Unigram(input_words, prob_dist, lexicon, args.maxlen, args.enable_log)
+
+
+def run_segmenter(line):
+    """Segment one line with the method selected on the command line, returning the
+    words, the k best segmentations or the lattice"""
+    segmenter = make_segmenter(line)
+    if args.nbest:
+        return segmenter.nbest(args.nbest)
+    if args.lattice is not None:
+        return segmenter.lattice(args.lattice)
+    return segmenter.segment()
+
+
+def format_result(n, result):
+    """Output for the n-th line of input"""
+    if args.nbest:
+        return "".join("%d ||| %s ||| %f\n" % (n, " ".join(words), score) for score, words in result)
+    if args.lattice is not None:
+        return " ".join("%d-%d:%.4f" % arc for arc in result) + "\n"
+    return " ".join(result) + "\n"
+
+
+def segment_lines(lines):
+    """Segment a chunk of lines, returning their results"""
+    if args.batch:
+        return batch_segmenter.segment([[i for i in line.strip()] for line in lines])
+    return [run_segmenter(line) for line in lines]
+
+
+def model_fingerprint():
+    """Identify the models and the settings that change the output, to key cached results"""
+    settings = (args.smooth, args.maxlen, args.mincount, args.topn, args.quantize, args.enable_unigram, args.beam, args.nbest, args.lattice)
+    return fingerprint(args.counts1w + args.counts2w, settings)
+
+
+def segment_file(f, workers, chunksize, cache=None):
+    """Segment the lines of f, writing the output in input order. Lines found in the
+    cache are answered directly, the rest are segmented in a pool of forked workers
+    when workers > 1"""
+    # fork, so the workers share the loaded tables instead of reloading or pickling them
+    pool = multiprocessing.get_context('fork').Pool(workers) if workers > 1 else None
+    pending = collections.deque()
+
+    def write_chunk():
+        (chunk, results, misses, job) = pending.popleft()
+        for key, result in zip(misses, job.get() if pool else job):
+            results[key] = result
+            if cache is not None:
+                cache.put(key, result)
+        sys.stdout.write("".join(format_result(n, results[key]) for n, key in chunk))
+
+    lines = enumerate(f)
+    while True:
+        # lines are keyed by their text without surrounding whitespace, which is all the segmenter sees
+        chunk = [(n, line.strip()) for n, line in itertools.islice(lines, chunksize)]
+        if not chunk:
+            break
+        results = {}
+        for _, key in chunk:
+            # repeats within the chunk are segmented once, with the first occurrence
+            if key in results:
+                if cache is not None:
+                    cache.repeat()
+                continue
+            results[key] = cache.get(key) if cache is not None else None
+        misses = [key for key, result in results.items() if result is None]
+        if pool:
+            pending.append((chunk, results, misses, pool.apply_async(segment_lines, (misses,))))
+        else:
+            pending.append((chunk, results, misses, segment_lines(misses)))
+        # keep a bounded number of chunks in flight so the input is streamed
+        if len(pending) >= 2 * workers:
+            write_chunk()
+    while pending:
+        write_chunk()
+    if pool:
+        pool.close()
+        pool.join()
+
+
+def load_models():
+    """Load the models selected by args into the module globals used by segment_lines,
+    and return the result cache, or None when it is disabled"""
+    global prob_dist, prob_dist2, bigram_dist, lexicon, batch_segmenter
     # the default segmenter does not use any probabilities, but you could ...
-    prob_dist = ProbDist(args.counts1w)
-    prob_dist2 = ProbDist(args.counts2w)
+    unknown = LengthPenalty(args.smooth, args.maxlen)
+    prob_dist = load_prob_dist(args.counts1w, args.mincount, args.topn, args.quantize, unknown)
+    prob_dist2 = load_prob_dist(args.counts2w, args.mincount, args.topn, unknown=unknown)
+    bigram_dist = load_bigram_dist(prob_dist2, prob_dist)
+    lexicon = Lexicon(prob_dist)
+    if args.batch:
+        if not args.enable_unigram or args.nbest or args.lattice is not None:
+            argparser.error("--batch only supports the 1-best unigram method")
+        # numpy is only needed for batch mode
+        from batch import BatchUnigram
+        batch_segmenter = BatchUnigram(prob_dist, lexicon, args.maxlen)
+    if args.cachesize > 0 or args.cachefile:
+        # hashing the count files is only worth it when results outlive the run
+        return LRUCache(args.cachesize, model_fingerprint() if args.cachefile else None, args.cachefile)
+    return None
+
+
+if __name__ == "__main__":
+    cache = load_models()
 
     # handle each line in input
     with open(args.input) as f:
-        for line in f:
-            line = line.strip()
-
-            # init input words list
-            input_words = [i for i in line]
-            if args.enable_log:
-                print("==> Input words: ", input_words, len(input_words))
-
-            if not args.enable_unigram:
-                # the bigram method
-                bigram = Bigram(input_words, prob_dist, prob_dist2)
-                bigram.segment()
-            else:
-                # the unigram method
-                unigram = Unigram(input_words, prob_dist)
-                unigram.segment()
+        segment_file(f, args.workers, args.chunksize, cache)
+    if cache is not None:
+        cache.close()
+        cache.report()
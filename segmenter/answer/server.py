@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import queue
+import signal
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import segment
+
+# arguments, anything else is passed on to segment.py
+argparser = argparse.ArgumentParser(description="serve answer/segment.py over http on localhost, the models are loaded once")
+argparser.add_argument("--host", dest='host', type=str, default='127.0.0.1', help="address to listen on")
+argparser.add_argument("--port", dest='port', type=int, default=8413, help="port to listen on")
+argparser.add_argument("--window", dest='window', type=float, default=5.0, help="milliseconds to wait for more requests to batch with the first one")
+argparser.add_argument("--maxbatch", dest='maxbatch', type=int, default=1024, help="maximum number of lines segmented in one batch")
+
+
+class Batcher(threading.Thread):
+    """Collects the lines of concurrent requests into batches, segmented one at a
+    time by this thread so the models and the cache are only used by one thread"""
+    def __init__(self, window, maxbatch, cache=None):
+        threading.Thread.__init__(self, daemon=True)
+        self.window = window
+        self.maxbatch = maxbatch
+        self.cache = cache
+        self.requests = queue.Queue()
+
+    def submit(self, lines):
+        """Segment lines, blocking until their batch is done, and return their results"""
+        request = {'lines': lines, 'done': threading.Event()}
+        self.requests.put(request)
+        request['done'].wait()
+        if 'error' in request:
+            raise request['error']
+        return request['results']
+
+    def run(self):
+        while True:
+            batch = [self.requests.get()]
+            size = len(batch[0]['lines'])
+            deadline = time.monotonic() + self.window
+            while size < self.maxbatch:
+                try:
+                    request = self.requests.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request['lines'])
+            try:
+                self.segment(batch)
+            except Exception as error:
+                for request in batch:
+                    request['error'] = error
+            for request in batch:
+                request['done'].set()
+
+    def segment(self, batch):
+        results = {}
+        for request in batch:
+            for key in request['lines']:
+                if key not in results:
+                    results[key] = self.cache.get(key) if self.cache is not None else None
+                elif self.cache is not None:
+                    self.cache.repeat()
+        misses = [key for key, result in results.items() if result is None]
+        for key, result in zip(misses, segment.segment_lines(misses)):
+            results[key] = result
+            if self.cache is not None:
+                self.cache.put(key, result)
+        for request in batch:
+            request['results'] = [results[key] for key in request['lines']]
+
+
+class SegmentHandler(BaseHTTPRequestHandler):
+    """POST /segment with one line per line of the body, the response has the
+    output for each line in the format selected by the segment.py options"""
+    def do_GET(self):
+        if self.path != '/health':
+            self.send_error(404)
+            return
+        self.reply(b'ok\n')
+
+    def do_POST(self):
+        if self.path != '/segment':
+            self.send_error(404)
+            return
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        lines = [line.strip() for line in body.splitlines()]
+        try:
+            results = self.server.batcher.submit(lines)
+        except Exception as error:
+            self.send_error(500, str(error))
+            return
+        self.reply("".join(segment.format_result(n, result) for n, result in enumerate(results)).encode('utf-8'))
+
+    def reply(self, data):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    (opts, segment_argv) = argparser.parse_known_args()
+    segment.args = segment.argparser.parse_args(segment_argv)
+    if segment.args.workers > 1:
+        argparser.error("the server segments in one process, run several servers to use more cores")
+
+    sys.stderr.write("Loading models...\n")
+    cache = segment.load_models()
+    batcher = Batcher(opts.window / 1000.0, opts.maxbatch, cache)
+    batcher.start()
+
+    server = ThreadingHTTPServer((opts.host, opts.port), SegmentHandler)
+    server.batcher = batcher
+    # shut down cleanly on kill too, so the cache store is closed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    sys.stderr.write("Serving on http://%s:%d/segment\n" % (opts.host, opts.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if cache is not None:
+            cache.close()
+            cache.report()
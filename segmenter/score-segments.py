@@ -1,22 +1,18 @@
 from __future__ import division
-import optparse, sys, codecs
-from collections import defaultdict
+from __future__ import print_function
+import optparse, sys, gzip
+from itertools import zip_longest
 
 optparser = optparse.OptionParser()
-optparser.add_option("-t", "--testfile", dest="testfile", default=None, help="Output from your segmenter program")
+optparser.add_option("-t", "--testfile", dest="testfiles", action="append", default=None, help="Output from your segmenter program, repeat to score several outputs in one pass (default: stdin)")
 optparser.add_option("-r", "--referencefile", dest="referencefile", default="data/reference", help="Reference segmentation")
-(opts, _) = optparser.parse_args()
+optparser.add_option("-s", "--spans", dest="spans", action="store_true", default=False, help="Score words as character spans, pooled over the corpus, instead of averaging the f-measure of word sets per line")
 
-if opts.testfile is None:
-    test = list(sys.stdin)
-else:
-    with open(opts.testfile) as f:
-        test = list(f)
-with open(opts.referencefile) as f:
-    reference = list(f)
-
-if len(test) != len(reference):
-    raise ValueError("Error: output and reference do not have identical number of lines")
+def open_segmentation(filename):
+    """open a segmentation for reading bytes, - is stdin and *.gz files are decompressed"""
+    if filename == '-':
+        return getattr(sys.stdin, 'buffer', sys.stdin)
+    return gzip.open(filename, 'rb') if filename[-3:] == '.gz' else open(filename, 'rb')
 
 def precision(reference, test):
     if len(test) == 0:
@@ -39,28 +35,85 @@ def fmeasure(reference, test, alpha=0.5):
         return 0
     return 1.0/(alpha/p + (1-alpha)/r)
 
-def corpus_fmeasure(reference, test):
-    """ 
+def boundaries(words):
+    """character offsets where a word starts or ends in increasing order"""
+    offsets = [0]
+    for w in words:
+        offsets.append(offsets[-1] + len(w))
+    return offsets
+
+class CorpusFMeasure(object):
+    """running average of the f-measure of each line"""
+    def __init__(self):
+        self.score = 0
+        self.lines = 0
+
+    def add(self, reference_words, test_line):
+        reference_len = sum(len(w) for w in reference_words)
+        test_words = test_line.decode('utf-8').split()
+        test_len = sum(len(w) for w in test_words)
+        test_utf8 = set(test_words)
+        if (reference_len != test_len) or (len(test_utf8) == 0):
+            test_utf8 = set(['empty'])
+        self.score += fmeasure(set(reference_words), test_utf8)
+        self.lines += 1
+
+    def value(self):
+        return (self.score/self.lines)*100
+
+class SpanFMeasure(object):
+    """precision and recall of words as character spans, pooled over the corpus.
+    A test word from offset s to e is correct when s and e are consecutive reference
+    boundaries, found by walking the two boundary lists together, so repeated words
+    are counted once per occurrence"""
+    def __init__(self):
+        self.correct = 0
+        self.test = 0
+        self.reference = 0
+
+    def add(self, reference_words, test_line):
+        reference_offsets = boundaries(reference_words)
+        test_offsets = boundaries(test_line.decode('utf-8').split())
+        self.reference += len(reference_offsets) - 1
+        self.test += len(test_offsets) - 1
+        if reference_offsets[-1] != test_offsets[-1]:
+            return
+        # both lists end at the line length, so a reference boundary follows every test word start
+        k = 0
+        for start, end in zip(test_offsets, test_offsets[1:]):
+            while reference_offsets[k] < start:
+                k += 1
+            if reference_offsets[k] == start and reference_offsets[k + 1] == end:
+                self.correct += 1
+
+    def value(self):
+        p = self.correct / self.test if self.test else 0
+        r = self.correct / self.reference if self.reference else 0
+        return (2*p*r/(p + r) if p + r else 0)*100
+
+def corpus_fmeasure(reference, tests, measure=CorpusFMeasure):
+    """
     assumes that the input lines are in UTF-8
     used to compute f-measure for Chinese word segmentation
-    sys.stdout is temporarily changed to enable debugging of UTF-8
+    reads the reference and all the tests in lockstep, so memory does not grow with the files
     """
-    old = sys.stdout
-    sys.stdout = codecs.lookup('utf-8')[-1](sys.stdout)
-    score = 0 
-    for i in range(len(reference)):
-        reference_len, test_len = 0,0
-        for w in unicode(reference[i], 'utf-8').split():
-            reference_len += len(w)
-        for w in unicode(test[i], 'utf-8').split():
-            test_len += len(w)
-        test_utf8 = set(unicode(test[i], 'utf-8').split())
-        reference_utf8 = set(unicode(reference[i], 'utf-8').split())
-        if (reference_len != test_len) or (len(test_utf8) == 0): 
-            test_utf8 = set(['empty'])
-        score += fmeasure(reference_utf8, test_utf8)
-    #print "Score: %.2f" % ((score/len(test))*100)
-    sys.stdout = old 
-    return ((score/len(test))*100)
+    scores = [measure() for _ in tests]
+    for lines in zip_longest(reference, *tests):
+        if None in lines:
+            raise ValueError("Error: output and reference do not have identical number of lines")
+        reference_words = lines[0].decode('utf-8').split()
+        for score, test_line in zip(scores, lines[1:]):
+            score.add(reference_words, test_line)
+    return [score.value() for score in scores]
 
-print "Score: %.2f" % corpus_fmeasure(reference, test)
+if __name__ == '__main__':
+    (opts, _) = optparser.parse_args()
+    testfiles = opts.testfiles or ['-']
+    reference = open_segmentation(opts.referencefile)
+    tests = [open_segmentation(testfile) for testfile in testfiles]
+    scores = corpus_fmeasure(reference, tests, SpanFMeasure if opts.spans else CorpusFMeasure)
+    if len(testfiles) == 1:
+        print("Score: %.2f" % scores[0])
+    else:
+        for testfile, score in zip(testfiles, scores):
+            print("Score: %.2f\t%s" % (score, testfile))